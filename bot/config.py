@@ -1,22 +1,40 @@
 """Конфигурация бота."""
+import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
 from dotenv import load_dotenv
 from loguru import logger
 
-load_dotenv()
 
-# Базовые пути
-BASE_DIR = Path(__file__).resolve().parent.parent
-DATA_DIR = BASE_DIR / "data"
-DATA_DIR.mkdir(exist_ok=True)
+@lru_cache(maxsize=1)
+def _load_env() -> bool:
+    """Загрузить .env один раз за процесс."""
+    load_dotenv()
+    return True
 
 
-def get_env(key: str, default: Optional[str] = None) -> str:
-    """Получить переменную окружения."""
-    import os
+_load_env()
+
+# Базовые пути (вычисляются лениво, при первом обращении)
+@lru_cache(maxsize=1)
+def base_dir() -> Path:
+    """Корень проекта."""
+    return Path(__file__).resolve().parent.parent
+
+
+@lru_cache(maxsize=1)
+def data_dir() -> Path:
+    """Каталог данных (создаётся при первом обращении)."""
+    path = base_dir() / "data"
+    path.mkdir(exist_ok=True)
+    return path
 
+
+@lru_cache(maxsize=None)
+def get_env(key: str, default: Optional[str] = None) -> str:
+    """Получить переменную окружения (кешируется, сброс — get_env.cache_clear())."""
     value = os.getenv(key, default)
     if not value and key == "BOT_TOKEN":
         logger.warning("Переменная окружения BOT_TOKEN не задана")
@@ -27,23 +45,27 @@ def get_env(key: str, default: Optional[str] = None) -> str:
 BOT_TOKEN = get_env("BOT_TOKEN")
 
 # Database
-DATABASE_URL = get_env("DATABASE_URL", f"sqlite+aiosqlite:///{DATA_DIR}/bot.db")
+@lru_cache(maxsize=1)
+def get_database_url() -> str:
+    """URL БД; по умолчанию SQLite в data/ (каталог создаётся только в этом случае)."""
+    return get_env("DATABASE_URL") or f"sqlite+aiosqlite:///{data_dir()}/bot.db"
+
 
 # Google Drive
 GOOGLE_DRIVE_CREDENTIALS_FILE = get_env("GOOGLE_DRIVE_CREDENTIALS_FILE")
 GOOGLE_DRIVE_FOLDER_ID = get_env("GOOGLE_DRIVE_FOLDER_ID")
 
 
-def get_superadmin_ids() -> list[int]:
-    """Получить список ID суперадминов."""
+def get_superadmin_ids() -> frozenset[int]:
+    """Получить множество ID суперадминов (O(1) проверка `in`)."""
     ids_str = get_env("SUPERADMIN_IDS", "")
     if not ids_str:
-        return []
+        return frozenset()
     try:
-        return [int(id_.strip()) for id_ in ids_str.split(",") if id_.strip()]
+        return frozenset(int(id_) for id_ in ids_str.split(",") if id_.strip())
     except ValueError:
         logger.error(f"Неверный формат SUPERADMIN_IDS: {ids_str}")
-        return []
+        return frozenset()
 
 
 SUPERADMIN_IDS = get_superadmin_ids()
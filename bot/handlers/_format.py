@@ -0,0 +1,62 @@
+"""Общие шаблоны сообщений для обработки заявок на вступление."""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bot.models import JoinRequest
+
+
+# Сообщения админу
+ALREADY_PROCESSED_MSG = "ℹ️ Заявка уже обработана или не найдена."
+SELECT_POSITION_MSG = (
+    "👔 <b>Выберите должность</b>\n\n"
+    "👤 Пользователь: {user}\n"
+    "🏢 Компания: {company}\n\n"
+    "Выберите должность для сотрудника:"
+)
+NO_POSITIONS_MSG = (
+    "⚠️ <b>Выбор должности</b>\n\n"
+    "👤 Пользователь: {user}\n"
+    "🏢 Компания: {company}\n\n"
+    "В компании пока нет должностей.\n"
+    "Вы можете добавить их через скрипт <code>manage_positions.py</code>"
+)
+APPROVED_MSG = (
+    "✅ <b>Заявка одобрена</b>\n\n"
+    "👤 Пользователь: {user}\n"
+    "🏢 Компания: {company}\n"
+    "{position}"
+)
+REJECTED_MSG = (
+    "❌ <b>Заявка отклонена</b>\n\n"
+    "👤 Пользователь: {user}\n"
+    "🏢 Компания: {company}"
+)
+PENDING_MSG = (
+    "📬 <b>Заявка на вступление</b>\n\n"
+    "👤 Пользователь: {user}\n"
+    "🏢 Компания: {company}\n\n"
+    "Что сделать с заявкой?"
+)
+
+# Уведомления пользователю
+USER_APPROVED_MSG = (
+    "🎉 <b>Ваша заявка одобрена!</b>\n\n"
+    "Вы добавлены в компанию «{company}».{position}\n\n"
+    "Отправьте /start для входа в меню."
+)
+USER_REJECTED_MSG = (
+    "❌ <b>Ваша заявка отклонена</b>\n\n"
+    "Заявка на вступление в компанию «{company}» была отклонена.\n\n"
+    "Если считаете это ошибкой, свяжитесь с администратором компании."
+)
+
+
+def format_user_display(jr: JoinRequest) -> str:
+    """Отображаемое имя автора заявки: @username, полное имя или ID."""
+    return (
+        f"@{jr.telegram_username}"
+        if jr.telegram_username
+        else jr.telegram_full_name or f"ID:{jr.telegram_id}"
+    )
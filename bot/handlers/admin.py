@@ -1,6 +1,8 @@
 """Обработка заявок администратором."""
 from __future__ import annotations
 
+import asyncio
+import re
 from datetime import datetime, timezone
 
 from loguru import logger
@@ -8,10 +10,73 @@ from loguru import logger
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import CallbackQueryHandler, ContextTypes
 
-from sqlalchemy import select
-
-from bot.models import Company, JoinRequest, JoinRequestStatus, Position, User, UserRole
+# Update/update из sqlalchemy — под псевдонимами: имя Update занято telegram.Update,
+# а хэндлеры принимают параметр update
+from sqlalchemy import StatementLambdaElement, insert, lambda_stmt, select
+from sqlalchemy import Update as SAUpdate
+from sqlalchemy import update as sa_update
+
+from bot.handlers._format import (
+    ALREADY_PROCESSED_MSG,
+    APPROVED_MSG,
+    NO_POSITIONS_MSG,
+    PENDING_MSG,
+    REJECTED_MSG,
+    SELECT_POSITION_MSG,
+    USER_APPROVED_MSG,
+    USER_REJECTED_MSG,
+    format_user_display,
+)
+from bot.models import JoinRequest, JoinRequestStatus, Position, User, UserRole
 from bot.models.base import async_session_factory
+from bot.services.database import get_active_positions, get_company_name
+
+
+_UTC = timezone.utc
+
+# callback_data паттерны (группы читаются в хэндлерах через context.matches)
+_RE_DECISION = re.compile(r"^jr:(approve|reject):(\d+)$")
+_RE_POSITION = re.compile(r"^jr:pos:(\d+):(\d+)$")
+_RE_CANCEL = re.compile(r"^jr:cancel:(\d+)$")
+
+
+# Запросы обработчиков заявок. lambda_stmt кеширует построение и компиляцию SQL
+# по месту определения лямбды; значения из замыкания уходят в bind-параметры.
+def _join_request_stmt(request_id: int) -> StatementLambdaElement:
+    """Заявка по id."""
+    return lambda_stmt(lambda: select(JoinRequest).where(JoinRequest.id == request_id))
+
+
+def _position_name_stmt(position_id: int) -> StatementLambdaElement:
+    """Название должности по id."""
+    return lambda_stmt(lambda: select(Position.name).where(Position.id == position_id))
+
+
+def _review_stmt(request_id: int, status: JoinRequestStatus, admin_telegram_id: int) -> SAUpdate:
+    """Перевести заявку из PENDING в status (0 затронутых строк — уже обработана).
+    
+    reviewed_by_user_id — User.id нажавшего админа в компании заявки, коррелированным
+    подзапросом в том же UPDATE (NULL, если в этой компании его нет).
+    """
+    admin_user_id = (
+        select(User.id)
+        .where(User.telegram_id == admin_telegram_id, User.company_id == JoinRequest.company_id)
+        .scalar_subquery()
+    )
+    return (
+        sa_update(JoinRequest)
+        .where(JoinRequest.id == request_id, JoinRequest.status == JoinRequestStatus.PENDING)
+        .values(status=status, reviewed_at=datetime.now(_UTC), reviewed_by_user_id=admin_user_id)
+    )
+
+
+def _log_notify_errors(results: list, telegram_id: int) -> None:
+    """Залогировать ошибки из asyncio.gather(edit админа, уведомление пользователя)."""
+    admin_error, user_error = results
+    if isinstance(admin_error, Exception):
+        logger.error("Ошибка обновления сообщения админа: {}", admin_error)
+    if isinstance(user_error, Exception):
+        logger.error("Ошибка уведомления пользователя {}: {}", telegram_id, user_error)
 
 
 async def handle_join_request_decision(
@@ -21,24 +86,19 @@ async def handle_join_request_decision(
     query = update.callback_query
     await query.answer()
 
-    data = query.data  # jr:approve:123 или jr:reject:123
-    parts = data.split(":")
-    if len(parts) != 3:
-        logger.error(f"Неверный формат callback_data: {data}")
-        return
-
-    action = parts[1]  # approve или reject
-    request_id = int(parts[2])
+    # jr:approve:123 или jr:reject:123 — уже разобрано regex-паттерном хэндлера
+    match = context.matches[0]
+    action = match.group(1)  # approve или reject
+    request_id = int(match.group(2))
 
     logger.info(
-        f"handle_join_request_decision: action={action}, request_id={request_id}, admin_id={update.effective_user.id}"
+        "handle_join_request_decision: action={}, request_id={}, admin_id={}",
+        action, request_id, update.effective_user.id,
     )
 
     async with async_session_factory() as session:
         # Получаем заявку
-        result = await session.execute(
-            select(JoinRequest).where(JoinRequest.id == request_id)
-        )
+        result = await session.execute(_join_request_stmt(request_id))
         join_request = result.scalar_one_or_none()
 
         if not join_request:
@@ -50,36 +110,13 @@ async def handle_join_request_decision(
             await query.edit_message_text(f"ℹ️ Эта заявка уже {status_text}.")
             return
 
-        # Получаем информацию о компании
-        company_result = await session.execute(
-            select(Company).where(Company.id == join_request.company_id)
-        )
-        company = company_result.scalar_one_or_none()
-        company_name = company.name if company else "Компания"
-
-        # Получаем User админа для записи reviewed_by
-        admin_result = await session.execute(
-            select(User).where(
-                User.telegram_id == update.effective_user.id,
-                User.company_id == join_request.company_id,
-            )
-        )
-        admin_user = admin_result.scalar_one_or_none()
+        company_name = await get_company_name(join_request.company_id)
 
         if action == "approve":
             # Получаем список должностей компании
-            positions_result = await session.execute(
-                select(Position)
-                .where(Position.company_id == join_request.company_id, Position.is_active == True)
-                .order_by(Position.sort_order)
-            )
-            positions = positions_result.scalars().all()
+            positions = await get_active_positions(join_request.company_id)
 
-            user_display = (
-                f"@{join_request.telegram_username}"
-                if join_request.telegram_username
-                else join_request.telegram_full_name or f"ID:{join_request.telegram_id}"
-            )
+            user_display = format_user_display(join_request)
 
             if not positions:
                 # Нет должностей — показываем предупреждение
@@ -88,72 +125,53 @@ async def handle_join_request_decision(
                     [InlineKeyboardButton("❌ Отмена", callback_data=f"jr:cancel:{request_id}")],
                 ]
                 await query.edit_message_text(
-                    f"⚠️ <b>Выбор должности</b>\n\n"
-                    f"👤 Пользователь: {user_display}\n"
-                    f"🏢 Компания: {company_name}\n\n"
-                    f"В компании пока нет должностей.\n"
-                    f"Вы можете добавить их через скрипт <code>manage_positions.py</code>",
+                    NO_POSITIONS_MSG.format(user=user_display, company=company_name),
                     reply_markup=InlineKeyboardMarkup(keyboard),
                     parse_mode="HTML",
                 )
             else:
                 # Показываем список должностей для выбора
-                keyboard = []
-                for pos in positions:
-                    keyboard.append([
-                        InlineKeyboardButton(
-                            f"👔 {pos.name}",
-                            callback_data=f"jr:pos:{request_id}:{pos.id}"
-                        )
-                    ])
+                keyboard = [
+                    [InlineKeyboardButton(f"👔 {pos_name}", callback_data=f"jr:pos:{request_id}:{pos_id}")]
+                    for pos_id, pos_name in positions
+                ]
                 keyboard.append([InlineKeyboardButton("📝 Без должности", callback_data=f"jr:pos:{request_id}:0")])
                 keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data=f"jr:cancel:{request_id}")])
 
                 await query.edit_message_text(
-                    f"👔 <b>Выберите должность</b>\n\n"
-                    f"👤 Пользователь: {user_display}\n"
-                    f"🏢 Компания: {company_name}\n\n"
-                    f"Выберите должность для сотрудника:",
+                    SELECT_POSITION_MSG.format(user=user_display, company=company_name),
                     reply_markup=InlineKeyboardMarkup(keyboard),
                     parse_mode="HTML",
                 )
 
         elif action == "reject":
-            # Отклоняем заявку
-            join_request.status = JoinRequestStatus.REJECTED
-            join_request.reviewed_at = datetime.now(timezone.utc)
-            if admin_user:
-                join_request.reviewed_by_user_id = admin_user.id
+            # Отклоняем заявку (только если она всё ещё на рассмотрении)
+            result = await session.execute(
+                _review_stmt(request_id, JoinRequestStatus.REJECTED, update.effective_user.id)
+            )
+            if result.rowcount == 0:
+                await session.rollback()
+                await query.edit_message_text(ALREADY_PROCESSED_MSG)
+                return
             await session.commit()
 
-            logger.info(f"Заявка {request_id} отклонена")
+            logger.info("Заявка {} отклонена", request_id)
 
-            # Обновляем сообщение админа
-            user_display = (
-                f"@{join_request.telegram_username}"
-                if join_request.telegram_username
-                else join_request.telegram_full_name or f"ID:{join_request.telegram_id}"
-            )
-            await query.edit_message_text(
-                f"❌ <b>Заявка отклонена</b>\n\n"
-                f"👤 Пользователь: {user_display}\n"
-                f"🏢 Компания: {company_name}",
-                parse_mode="HTML",
-            )
-
-            # Уведомляем пользователя
-            try:
-                await context.bot.send_message(
+            user_display = format_user_display(join_request)
+            # Обновляем сообщение админа и уведомляем пользователя параллельно
+            results = await asyncio.gather(
+                query.edit_message_text(
+                    REJECTED_MSG.format(user=user_display, company=company_name),
+                    parse_mode="HTML",
+                ),
+                context.bot.send_message(
                     chat_id=join_request.telegram_id,
-                    text=(
-                        f"❌ <b>Ваша заявка отклонена</b>\n\n"
-                        f"Заявка на вступление в компанию «{company_name}» была отклонена.\n\n"
-                        f"Если считаете это ошибкой, свяжитесь с администратором компании."
-                    ),
+                    text=USER_REJECTED_MSG.format(company=company_name),
                     parse_mode="HTML",
-                )
-            except Exception as e:
-                logger.error(f"Ошибка уведомления пользователя {join_request.telegram_id}: {e}")
+                ),
+                return_exceptions=True,
+            )
+            _log_notify_errors(results, join_request.telegram_id)
 
 
 async def handle_position_selection(
@@ -163,24 +181,19 @@ async def handle_position_selection(
     query = update.callback_query
     await query.answer()
 
-    data = query.data  # jr:pos:123:456 (request_id:position_id)
-    parts = data.split(":")
-    if len(parts) != 4:
-        logger.error(f"Неверный формат callback_data: {data}")
-        return
-
-    request_id = int(parts[2])
-    position_id = int(parts[3])  # 0 = без должности
+    # jr:pos:123:456 (request_id:position_id) — уже разобрано regex-паттерном хэндлера
+    match = context.matches[0]
+    request_id = int(match.group(1))
+    position_id = int(match.group(2))  # 0 = без должности
 
     logger.info(
-        f"handle_position_selection: request_id={request_id}, position_id={position_id}, admin_id={update.effective_user.id}"
+        "handle_position_selection: request_id={}, position_id={}, admin_id={}",
+        request_id, position_id, update.effective_user.id,
     )
 
     async with async_session_factory() as session:
         # Получаем заявку
-        result = await session.execute(
-            select(JoinRequest).where(JoinRequest.id == request_id)
-        )
+        result = await session.execute(_join_request_stmt(request_id))
         join_request = result.scalar_one_or_none()
 
         if not join_request:
@@ -192,84 +205,58 @@ async def handle_position_selection(
             await query.edit_message_text(f"ℹ️ Эта заявка уже {status_text}.")
             return
 
-        # Получаем информацию о компании
-        company_result = await session.execute(
-            select(Company).where(Company.id == join_request.company_id)
-        )
-        company = company_result.scalar_one_or_none()
-        company_name = company.name if company else "Компания"
+        company_name = await get_company_name(join_request.company_id)
 
         # Получаем должность (если выбрана)
         position_name = None
         if position_id > 0:
-            position_result = await session.execute(
-                select(Position).where(Position.id == position_id)
-            )
-            position = position_result.scalar_one_or_none()
-            if position:
-                position_name = position.name
-
-        # Получаем User админа для записи reviewed_by
-        admin_result = await session.execute(
-            select(User).where(
-                User.telegram_id == update.effective_user.id,
-                User.company_id == join_request.company_id,
-            )
+            position_result = await session.execute(_position_name_stmt(position_id))
+            position_name = position_result.scalar_one_or_none()
+
+        # Одобряем заявку и создаём пользователя в компании одной транзакцией
+        # (Core UPDATE + INSERT, без flush через identity map).
+        # UPDATE условный: если другой админ успел обработать заявку — выходим.
+        result = await session.execute(
+            _review_stmt(request_id, JoinRequestStatus.APPROVED, update.effective_user.id)
         )
-        admin_user = admin_result.scalar_one_or_none()
-
-        # Одобряем заявку
-        join_request.status = JoinRequestStatus.APPROVED
-        join_request.reviewed_at = datetime.now(timezone.utc)
-        if admin_user:
-            join_request.reviewed_by_user_id = admin_user.id
-
-        # Создаём пользователя в компании
-        new_user = User(
-            telegram_id=join_request.telegram_id,
-            company_id=join_request.company_id,
-            role=UserRole.EMPLOYEE,
-            full_name=join_request.telegram_full_name,
-            position_id=position_id if position_id > 0 else None,
+        if result.rowcount == 0:
+            await session.rollback()
+            await query.edit_message_text(ALREADY_PROCESSED_MSG)
+            return
+        await session.execute(
+            insert(User).values(
+                telegram_id=join_request.telegram_id,
+                company_id=join_request.company_id,
+                role=UserRole.EMPLOYEE,
+                full_name=join_request.telegram_full_name,
+                position_id=position_id if position_id > 0 else None,
+            )
         )
-        session.add(new_user)
         await session.commit()
 
         logger.info(
-            f"Заявка {request_id} одобрена с должностью {position_name or 'без должности'}, "
-            f"создан user для telegram_id={join_request.telegram_id}"
+            "Заявка {} одобрена с должностью {}, создан user для telegram_id={}",
+            request_id, position_name or "без должности", join_request.telegram_id,
         )
 
-        # Обновляем сообщение админа
-        user_display = (
-            f"@{join_request.telegram_username}"
-            if join_request.telegram_username
-            else join_request.telegram_full_name or f"ID:{join_request.telegram_id}"
-        )
+        user_display = format_user_display(join_request)
         position_text = f"👔 Должность: {position_name}" if position_name else "👔 Должность: не назначена"
-
-        await query.edit_message_text(
-            f"✅ <b>Заявка одобрена</b>\n\n"
-            f"👤 Пользователь: {user_display}\n"
-            f"🏢 Компания: {company_name}\n"
-            f"{position_text}",
-            parse_mode="HTML",
-        )
-
-        # Уведомляем пользователя
         position_info = f"\n👔 Должность: {position_name}" if position_name else ""
-        try:
-            await context.bot.send_message(
+
+        # Обновляем сообщение админа и уведомляем пользователя параллельно
+        results = await asyncio.gather(
+            query.edit_message_text(
+                APPROVED_MSG.format(user=user_display, company=company_name, position=position_text),
+                parse_mode="HTML",
+            ),
+            context.bot.send_message(
                 chat_id=join_request.telegram_id,
-                text=(
-                    f"🎉 <b>Ваша заявка одобрена!</b>\n\n"
-                    f"Вы добавлены в компанию «{company_name}».{position_info}\n\n"
-                    f"Отправьте /start для входа в меню."
-                ),
+                text=USER_APPROVED_MSG.format(company=company_name, position=position_info),
                 parse_mode="HTML",
-            )
-        except Exception as e:
-            logger.error(f"Ошибка уведомления пользователя {join_request.telegram_id}: {e}")
+            ),
+            return_exceptions=True,
+        )
+        _log_notify_errors(results, join_request.telegram_id)
 
 
 async def handle_cancel_approval(
@@ -279,37 +266,22 @@ async def handle_cancel_approval(
     query = update.callback_query
     await query.answer()
 
-    data = query.data  # jr:cancel:123
-    parts = data.split(":")
-    if len(parts) != 3:
-        logger.error(f"Неверный формат callback_data: {data}")
-        return
-
-    request_id = int(parts[2])
+    # jr:cancel:123 — уже разобрано regex-паттерном хэндлера
+    match = context.matches[0]
+    request_id = int(match.group(1))
 
     async with async_session_factory() as session:
         # Получаем заявку
-        result = await session.execute(
-            select(JoinRequest).where(JoinRequest.id == request_id)
-        )
+        result = await session.execute(_join_request_stmt(request_id))
         join_request = result.scalar_one_or_none()
 
         if not join_request or join_request.status != JoinRequestStatus.PENDING:
-            await query.edit_message_text("ℹ️ Заявка уже обработана или не найдена.")
+            await query.edit_message_text(ALREADY_PROCESSED_MSG)
             return
 
-        # Получаем информацию о компании
-        company_result = await session.execute(
-            select(Company).where(Company.id == join_request.company_id)
-        )
-        company = company_result.scalar_one_or_none()
-        company_name = company.name if company else "Компания"
+        company_name = await get_company_name(join_request.company_id)
 
-        user_display = (
-            f"@{join_request.telegram_username}"
-            if join_request.telegram_username
-            else join_request.telegram_full_name or f"ID:{join_request.telegram_id}"
-        )
+        user_display = format_user_display(join_request)
 
         # Возвращаем исходные кнопки
         keyboard = InlineKeyboardMarkup([
@@ -320,10 +292,7 @@ async def handle_cancel_approval(
         ])
 
         await query.edit_message_text(
-            f"📬 <b>Заявка на вступление</b>\n\n"
-            f"👤 Пользователь: {user_display}\n"
-            f"🏢 Компания: {company_name}\n\n"
-            f"Что сделать с заявкой?",
+            PENDING_MSG.format(user=user_display, company=company_name),
             reply_markup=keyboard,
             parse_mode="HTML",
         )
@@ -334,14 +303,14 @@ def get_admin_handlers() -> list[CallbackQueryHandler]:
     return [
         CallbackQueryHandler(
             handle_join_request_decision,
-            pattern=r"^jr:(approve|reject):\d+$",
+            pattern=_RE_DECISION,
         ),
         CallbackQueryHandler(
             handle_position_selection,
-            pattern=r"^jr:pos:\d+:\d+$",
+            pattern=_RE_POSITION,
         ),
         CallbackQueryHandler(
             handle_cancel_approval,
-            pattern=r"^jr:cancel:\d+$",
+            pattern=_RE_CANCEL,
         ),
     ]
@@ -1,30 +1,56 @@
 """Процесс проработки — создание акта."""
 from __future__ import annotations
 
+import asyncio
+import atexit
+import io
 import re
-from typing import Any
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache, partial, wraps
+from itertools import islice
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, TypeVar
 
 from loguru import logger
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import (
+    CallbackQuery,
+    Document,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    PhotoSize,
+    Update,
+)
+from telegram.error import BadRequest
 from telegram.ext import (
     CallbackQueryHandler,
     ContextTypes,
     ConversationHandler,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
-from bot.services.google_sheets import google_sheets_service
-from bot.services.google_drive import get_spreadsheet_link, upload_file_to_drive, get_file_link
-from bot.services.iiko_service import iiko_service, search_products
+from bot.services.google_sheets import DevRequest, google_sheets_service
+from bot.services.google_drive import get_spreadsheet_link, upload_bytes_to_drive, get_file_link
+from bot.services.iiko_service import (
+    IikoProduct,
+    find_product_by_name,
+    iiko_service,
+    search_index_version,
+    search_products,
+)
 from bot.services.act_generator import (
     generate_act_for_request,
     get_act_cell_value,
     add_photos_to_act,
     export_act_to_pdf,
 )
-from bot.services.database import get_user_company_info
+from bot.services.database import get_user_company_info_cached
+from bot.services.email_service import DEFAULT_CC, EmailMessage, send_email
 from bot.keyboards.main import get_main_menu_keyboard
 from bot.config import SUPERADMIN_IDS
 
@@ -45,41 +71,257 @@ from bot.config import SUPERADMIN_IDS
     COMPLETE_CONFIRM,         # Подтверждение
 ) = range(11)
 
+T = TypeVar("T")
+
+# Статус «⏳ ...» показывается, только если операция идёт дольше этого времени
+PROGRESS_DELAY = 0.5  # секунд
+
+# Сколько заявок показывается кнопками в списке
+MAX_VISIBLE_REQUESTS = 10
+
+# Брошенный диалог завершается через 15 минут бездействия — данные из user_data удаляются
+CONVERSATION_TIMEOUT = 15 * 60  # секунд
 
+# Регулярные выражения (компилируются один раз при импорте)
+_FOLDER_RE = re.compile(r"folders/([a-zA-Z0-9_-]+)")
+_FILE_ID_RE = re.compile(r"/d/([a-zA-Z0-9_-]+)")
+_ID_RE = re.compile(r"id=([a-zA-Z0-9_-]+)")
+_ID_CHARS = frozenset(string.ascii_letters + string.digits + "_-")
+
+# Отдельный пул для генерации и экспорта актов: копирование шаблона и выгрузка PDF
+# медленные и не должны занимать пул по умолчанию, которым пользуются остальные to_thread
+_ACT_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="act-gen")
+atexit.register(_ACT_EXECUTOR.shutdown, wait=False)
+
+# Статичные тексты и клавиатуры (InlineKeyboardMarkup неизменяем — можно переиспользовать)
+_DEV_MENU_TEXT = (
+    "🔄 <b>Проработки (Заявки)</b>\n\n"
+    "Выберите действие:"
+)
+_DEV_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📝 Выбрать заявку", callback_data="dev:create_act")],
+    [InlineKeyboardButton("❌ Закрыть", callback_data="dev:close")],
+])
+# Строки «Отмена» для клавиатур обоих этапов
+_CANCEL_ROW_DEV = (InlineKeyboardButton("❌ Отмена", callback_data="dev:cancel"),)
+_CANCEL_ROW_COMPL = (InlineKeyboardButton("❌ Отмена", callback_data="compl:cancel"),)
+_ACT_CONFIRM_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Создать акт", callback_data="dev:confirm_create")],
+    [InlineKeyboardButton("🔄 Выбрать другой продукт", callback_data="dev:manual_search")],
+    _CANCEL_ROW_DEV,
+])
+_PHOTOS_START_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Завершить загрузку фото", callback_data="compl:photos_done")],
+    _CANCEL_ROW_COMPL,
+])
+_RESULT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Подходит", callback_data="compl:result:yes")],
+    [InlineKeyboardButton("❌ Не подходит", callback_data="compl:result:no")],
+    _CANCEL_ROW_COMPL,
+])
+_COMMENT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➡️ Пропустить", callback_data="compl:comment:skip")],
+    _CANCEL_ROW_COMPL,
+])
+_MASS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Да", callback_data="compl:mass:yes")],
+    [InlineKeyboardButton("❌ Нет", callback_data="compl:mass:no")],
+    _CANCEL_ROW_COMPL,
+])
+_FINISH_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Подтвердить и завершить", callback_data="compl:finish")],
+    _CANCEL_ROW_COMPL,
+])
+_NO_COMPANY_MSG = "❌ Вы не привязаны к компании. Используйте /start для регистрации."
+_NO_NEW_REQUESTS_MSG = (
+    "📭 Нет новых заявок на проработку.\n\n"
+    "Все заявки уже взяты в работу или завершены."
+)
+_NO_ACTIVE_REQUESTS_MSG = (
+    "📭 <b>Нет активных заявок</b>\n\n"
+    "У вас нет заявок в работе.\n"
+    "Сначала выберите заявку через меню «Проработки (Заявки)» → «Выбрать заявку»."
+)
+_NEW_REQUESTS_TMPL = (
+    "📋 <b>Новые заявки на проработку</b>\n\n"
+    "Найдено заявок: {total}\n"
+    "Выберите заявку для создания акта:"
+)
+_IN_PROGRESS_REQUESTS_TMPL = (
+    "📋 <b>Заявки в работе</b> ({total} шт)\n\n"
+    "Выберите заявку для завершения:"
+)
+
+_ACT_SUMMARY_TMPL = (
+    "📋 <b>Сводка для создания акта</b>\n\n"
+    "<b>Заявка:</b> {request_id}\n"
+    "<b>Поставщик:</b> {supplier_name}\n"
+    "<b>Товар поставщика:</b> {nomenclature}\n"
+    "<b>Цена поставщика:</b> {supplier_price} руб.\n\n"
+    "<b>Продукт iiko:</b> {product_name}\n"
+    "<b>Цена iiko:</b> {iiko_price:.2f} руб.{price_diff}\n\n"
+    "Создать акт проработки?"
+)
+# Сравнение цены поставщика с iiko по знаку разницы: [0] равна, [1] дороже, [-1] дешевле
+_PRICE_DIFF_TMPL = ("➡️ Цена равна", "📈 Дороже на {:.1f}%", "📉 Дешевле на {:.1f}%")
+_COMPLETE_CONFIRM_TMPL = (
+    "📋 <b>Подтверждение завершения</b>\n\n"
+    "📦 Заявка: {request_id}\n"
+    "📋 Товар: {nomenclature}\n"
+    "📸 Фото: {photos_count}\n"
+    "📊 Результат: {full_result}\n"
+    "{mass_line}"
+    "{weight_line}"
+    "\nНажмите «Подтвердить» для завершения."
+)
+_COMPLETE_DONE_TMPL = (
+    "✅ <b>Проработка завершена!</b>\n\n"
+    "📦 Заявка: {request_id}\n"
+    "📋 Товар: {nomenclature}\n"
+    "📊 Результат: {full_result}\n"
+    "{mass_line}"
+    "\n{email_line}"
+)
+_COMPLETION_EMAIL_FOOTER = (
+    "\n"
+    "Акт проработки прикреплён к письму.\n"
+    "\n"
+    "С уважением,\n"
+    "WorkFlow Hub\n"
+)
+_COMPLETION_EMAIL_TMPL = (
+    "Результат проработки продукта\n"
+    "\n"
+    "Заявка: {request_id}\n"
+    "Товар: {nomenclature}\n"
+    "Поставщик: {supplier_name}\n"
+    "Результат: {result}\n"
+    "{mass_line}"
+) + _COMPLETION_EMAIL_FOOTER
+
+
+class _BlankDict(dict):
+    """Словарь для str.format_map: отсутствующий ключ — пустая строка."""
+    
+    def __missing__(self, key: str) -> str:
+        return ""
+
+
+# Ключи user_data этапа создания акта
+_CTX_KEYS = frozenset({
+    "company_info",
+    "selected_request",
+    "selected_product",
+    "iiko_price",
+})
+# Ключи user_data этапа завершения проработки
+_COMPLETE_KEYS = frozenset({
+    "complete_company_info",
+    "complete_selected",
+    "complete_photos",
+    "complete_act_id",
+    "complete_folder_id",
+    "complete_result",
+    "complete_comment",
+    "complete_mass_prorabotka",
+    "complete_weight",
+})
+
+# Очередь фоновых задач по чату: акты одного пользователя создаются последовательно.
+# chat_id -> [замок, число задач, которые держат или ждут его]; запись удаляется с последней
+_CHAT_LOCKS: dict[int, list] = {}
+# Заявки, по которым акт создаётся прямо сейчас: (sheet_id, номер строки).
+# Реестр помечается «в работе» только после создания акта — до этого заявку
+# не показываем в списке новых, чтобы по ней не начали второй акт.
+_ACTS_IN_PROGRESS: set[tuple[str, int]] = set()
+
+# Незавершённые загрузки фото в Drive: telegram_id -> задачи (в порядке отправки)
+_PENDING_UPLOADS: dict[int, list[asyncio.Task]] = {}
+
+# callback_data этапа создания акта: dev:<действие>[:<параметр>]
+_DEV_CALLBACK_RE = re.compile(r"^dev:([a-z_]+)(?::|$)")
+
+# Нормализация цены из таблицы: "1 234,50" -> "1234.50" за один проход
+_PRICE_TRANS = str.maketrans({",": ".", " ": "", "\u00A0": ""})
+
+# Кеш результатов поиска продуктов: (запрос, limit) -> (момент, версия индекса, продукты)
+# Версия индекса меняется при синхронизации iiko, поэтому TTL лишь ограничивает возраст записи.
+_SEARCH_TTL = 600.0  # секунд
+_SEARCH_CACHE_MAX = 4096
+_SEARCH_CACHE: dict[tuple[str, int], tuple[float, int, list[IikoProduct]]] = {}
+# Поиски, выполняющиеся прямо сейчас: одинаковые запросы ждут один и тот же результат
+_SEARCH_INFLIGHT: dict[tuple[str, int], asyncio.Future[list[IikoProduct]]] = {}
+
+
+@asynccontextmanager
+async def _chat_queue(chat_id: int) -> AsyncIterator[None]:
+    """Выполнять фоновые задачи чата по очереди; замок чата удаляется, когда очередь пуста."""
+    entry = _CHAT_LOCKS.get(chat_id)
+    if entry is None:
+        entry = _CHAT_LOCKS[chat_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _CHAT_LOCKS[chat_id]
+
+
+def _cleanup_on_end(
+    handler: Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[int]],
+) -> Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[int]]:
+    """Очистить данные диалога, когда обработчик завершает его или падает с ошибкой.
+    
+    Так списки заявок, найденные продукты и фото не остаются в user_data
+    (и в файле persistence) после любого выхода из диалога.
+    """
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        try:
+            state = await handler(update, context)
+        except Exception:
+            _cleanup_context(context)
+            _cleanup_complete_context(context)
+            raise
+        if state == ConversationHandler.END:
+            _cleanup_context(context)
+            _cleanup_complete_context(context)
+        return state
+    
+    return wrapper
+
+
+@_cleanup_on_end
 async def show_development_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Показать меню процесса проработки."""
     user_id = update.effective_user.id
     logger.info(f"show_development_menu: user_id={user_id}")
     
-    keyboard = [
-        [InlineKeyboardButton("📝 Выбрать заявку", callback_data="dev:create_act")],
-        [InlineKeyboardButton("❌ Закрыть", callback_data="dev:close")],
-    ]
-    
     await update.message.reply_text(
-        "🔄 <b>Проработки (Заявки)</b>\n\n"
-        "Выберите действие:",
+        _DEV_MENU_TEXT,
         parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_DEV_MENU_MARKUP,
     )
     
     return DEV_MENU
 
 
+@_cleanup_on_end
 async def create_act_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Начать создание акта — показать список новых заявок."""
     query = update.callback_query
-    await query.answer()
-    
     user_id = update.effective_user.id
     logger.info(f"create_act_start: user_id={user_id}")
     
-    # Получаем информацию о компании пользователя
-    company_info = await get_user_company_info(user_id)
+    # Отвечаем на callback и получаем информацию о компании параллельно
+    _, company_info = await asyncio.gather(
+        query.answer(),
+        get_user_company_info_cached(user_id),
+    )
     if not company_info:
-        await query.edit_message_text(
-            "❌ Вы не привязаны к компании. Используйте /start для регистрации."
-        )
+        await _safe_edit(query, _NO_COMPANY_MSG)
         return ConversationHandler.END
     
     context.user_data["company_info"] = {
@@ -92,113 +334,107 @@ async def create_act_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     requests = await google_sheets_service.get_new_development_requests(
         sheet_id=company_info.sheet_id,
     )
+    # Заявки, по которым акт ещё создаётся в фоне, в реестре пока «новые» — скрываем их
+    if _ACTS_IN_PROGRESS:
+        requests = [
+            req for req in requests
+            if (company_info.sheet_id, req.row_number) not in _ACTS_IN_PROGRESS
+        ]
     
     if not requests:
-        await query.edit_message_text(
-            "📭 Нет новых заявок на проработку.\n\n"
-            "Все заявки уже взяты в работу или завершены."
-        )
+        await _safe_edit(query, _NO_NEW_REQUESTS_MSG)
         return ConversationHandler.END
     
-    # Сохраняем заявки в контексте
-    context.user_data["dev_requests"] = requests
+    # Кнопками доступны только первые заявки — в контексте храним только их
+    # (по номеру строки — для выбора за O(1))
+    total = len(requests)
+    visible = list(islice(requests, MAX_VISIBLE_REQUESTS))
+    _dev_cache(context)["dev_requests_by_row"] = {req.row_number: req for req in visible}
     
-    # Формируем клавиатуру с заявками
-    keyboard = []
-    for req in requests[:10]:  # Максимум 10 заявок
-        label = f"{req['request_id']} | {req['supplier_name'][:15]} | {req['nomenclature'][:20]}"
-        keyboard.append([
-            InlineKeyboardButton(label, callback_data=f"dev:req:{req['row_number']}")
-        ])
+    def build_requests_view() -> tuple[str, InlineKeyboardMarkup]:
+        # Формируем клавиатуру с заявками
+        keyboard = [
+            [InlineKeyboardButton(req.label, callback_data=f"dev:req:{req.row_number}")]
+            for req in visible
+        ]
+        keyboard.append(_CANCEL_ROW_DEV)
+        
+        return _NEW_REQUESTS_TMPL.format(total=total), InlineKeyboardMarkup(keyboard)
     
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="dev:cancel")])
+    fingerprint = hash((total, tuple((req.row_number, req.request_id) for req in visible)))
+    text, markup = _memo_in_dev_cache(context, "_dev_req_view", fingerprint, build_requests_view)
     
-    await query.edit_message_text(
-        f"📋 <b>Новые заявки на проработку</b>\n\n"
-        f"Найдено заявок: {len(requests)}\n"
-        f"Выберите заявку для создания акта:",
+    await _safe_edit(
+        query,
+        text,
         parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=markup,
     )
     
     return DEV_SELECT_REQUEST
 
 
+@_cleanup_on_end
 async def request_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка выбора заявки — предложить продукты из iiko."""
     query = update.callback_query
     await query.answer()
     
-    # Извлекаем номер строки из callback_data
-    match = re.match(r"dev:req:(\d+)", query.data)
-    if not match:
-        await query.edit_message_text("❌ Ошибка: неверный формат данных.")
+    # Извлекаем номер строки из callback_data (формат уже проверен паттерном хэндлера)
+    try:
+        row_number = int(query.data.rpartition(":")[2])
+    except ValueError:
+        await _safe_edit(query, "❌ Ошибка: неверный формат данных.")
         return ConversationHandler.END
     
-    row_number = int(match.group(1))
     logger.info(f"request_selected: row_number={row_number}")
     
-    # Находим заявку в сохранённом списке
-    requests = context.user_data.get("dev_requests", [])
-    selected_request = None
-    for req in requests:
-        if req["row_number"] == row_number:
-            selected_request = req
-            break
+    # Находим заявку в сохранённых
+    selected_request = _dev_cache(context).get("dev_requests_by_row", {}).get(row_number)
     
     if not selected_request:
-        await query.edit_message_text("❌ Заявка не найдена.")
+        await _safe_edit(query, "❌ Заявка не найдена.")
         return ConversationHandler.END
     
     context.user_data["selected_request"] = selected_request
     
-    # Показываем информацию о заявке
-    await query.edit_message_text(
-        f"📦 <b>Выбрана заявка</b>\n\n"
-        f"ID: {selected_request['request_id']}\n"
-        f"Поставщик: {selected_request['supplier_name']}\n"
-        f"Товар: {selected_request['nomenclature']}\n"
-        f"Цена поставщика: {selected_request['price']} руб.\n\n"
-        f"⏳ Ищу похожие продукты в iiko...",
-        parse_mode="HTML",
-    )
-    
     # Ищем похожие продукты в кеше iiko
-    nomenclature = selected_request["nomenclature"]
-    
-    # Пробуем найти по первым словам названия
-    search_terms = nomenclature.split()[:2]  # Первые 2 слова
-    search_query = " ".join(search_terms) if search_terms else nomenclature[:20]
-    
-    products = await search_products(search_query, limit=5)
+    nomenclature = selected_request.nomenclature
+    
+    # Информацию о заявке со статусом показываем, только если поиск затянулся
+    products = await _await_with_progress(
+        _suggest_products(nomenclature),
+        lambda: query.edit_message_text(
+            f"📦 <b>Выбрана заявка</b>\n\n"
+            f"ID: {selected_request.request_id}\n"
+            f"Поставщик: {selected_request.supplier_name}\n"
+            f"Товар: {selected_request.nomenclature}\n"
+            f"Цена поставщика: {selected_request.price} руб.\n\n"
+            f"⏳ Ищу похожие продукты в iiko...",
+            parse_mode="HTML",
+        ),
+    )
     
     if products:
-        context.user_data["found_products"] = products
+        _dev_cache(context)["found_products"] = {prod.id: prod for prod in products}
+        markup = _products_markup(context, products, "🔍 Искать вручную")
         
-        keyboard = []
-        for i, prod in enumerate(products):
-            label = f"{prod['name'][:40]}"
-            keyboard.append([
-                InlineKeyboardButton(label, callback_data=f"dev:prod:{i}")
-            ])
-        
-        keyboard.append([InlineKeyboardButton("🔍 Искать вручную", callback_data="dev:manual_search")])
-        keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="dev:cancel")])
-        
-        await query.edit_message_text(
-            f"📦 <b>Заявка {selected_request['request_id']}</b>\n"
+        await _safe_edit(
+            query,
+            f"📦 <b>Заявка {selected_request.request_id}</b>\n"
             f"Товар поставщика: {nomenclature}\n\n"
             f"🔍 Найдены похожие продукты в iiko:\n"
             f"Выберите продукт для сопоставления:",
             parse_mode="HTML",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=markup,
         )
         
         return DEV_SELECT_PRODUCT
     else:
         # Не нашли — предлагаем ручной поиск
-        await query.edit_message_text(
-            f"📦 <b>Заявка {selected_request['request_id']}</b>\n"
+        await _safe_edit(
+            query,
+            f"📦 <b>Заявка {selected_request.request_id}</b>\n"
             f"Товар поставщика: {nomenclature}\n\n"
             f"❌ Похожие продукты не найдены в кеше iiko.\n\n"
             f"Введите название для поиска:",
@@ -208,15 +444,18 @@ async def request_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return DEV_SEARCH_PRODUCT
 
 
+@_cleanup_on_end
 async def manual_search_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Начать ручной поиск продукта."""
     query = update.callback_query
     await query.answer()
     
-    selected_request = context.user_data.get("selected_request", {})
+    selected_request = context.user_data.get("selected_request")
+    request_id = selected_request.request_id if selected_request else "?"
     
-    await query.edit_message_text(
-        f"📦 <b>Заявка {selected_request.get('request_id', '?')}</b>\n\n"
+    await _safe_edit(
+        query,
+        f"📦 <b>Заявка {request_id}</b>\n\n"
         f"🔍 Введите название продукта для поиска в iiko:",
         parse_mode="HTML",
     )
@@ -224,6 +463,7 @@ async def manual_search_start(update: Update, context: ContextTypes.DEFAULT_TYPE
     return DEV_SEARCH_PRODUCT
 
 
+@_cleanup_on_end
 async def search_product(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка ручного поиска продукта."""
     search_query = update.message.text.strip()
@@ -236,7 +476,7 @@ async def search_product(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return DEV_SEARCH_PRODUCT
     
     # Ищем в кеше
-    products = await search_products(search_query, limit=10)
+    products = await _cached_search_products(search_query, limit=10)
     
     if not products:
         await update.message.reply_text(
@@ -245,225 +485,278 @@ async def search_product(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return DEV_SEARCH_PRODUCT
     
-    context.user_data["found_products"] = products
-    
-    keyboard = []
-    for i, prod in enumerate(products):
-        label = f"{prod['name'][:40]}"
-        keyboard.append([
-            InlineKeyboardButton(label, callback_data=f"dev:prod:{i}")
-        ])
-    
-    keyboard.append([InlineKeyboardButton("🔍 Искать ещё", callback_data="dev:manual_search")])
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="dev:cancel")])
+    _dev_cache(context)["found_products"] = {prod.id: prod for prod in products}
+    markup = _products_markup(context, products, "🔍 Искать ещё")
     
     await update.message.reply_text(
         f"🔍 Найдено {len(products)} продуктов:\n\n"
         f"Выберите продукт для сопоставления:",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=markup,
     )
     
     return DEV_SELECT_PRODUCT
 
 
+@_cleanup_on_end
 async def product_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка выбора продукта — получить цену и создать акт."""
     query = update.callback_query
     await query.answer()
     
-    # Извлекаем индекс продукта
-    match = re.match(r"dev:prod:(\d+)", query.data)
-    if not match:
-        await query.edit_message_text("❌ Ошибка: неверный формат данных.")
-        return ConversationHandler.END
-    
-    product_idx = int(match.group(1))
-    products = context.user_data.get("found_products", [])
+    # Извлекаем ID продукта iiko (формат dev:prod:<id> уже проверен роутером)
+    product_id = query.data.rpartition(":")[2]
+    selected_product = _dev_cache(context).get("found_products", {}).get(product_id)
     
-    if product_idx >= len(products):
-        await query.edit_message_text("❌ Продукт не найден.")
+    if not selected_product:
+        await _safe_edit(query, "❌ Продукт не найден.")
         return ConversationHandler.END
     
-    selected_product = products[product_idx]
     context.user_data["selected_product"] = selected_product
     
-    logger.info(f"product_selected: {selected_product['name']}")
+    logger.info(f"product_selected: {selected_product.name}")
     
-    # Показываем статус
-    await query.edit_message_text(
-        f"⏳ Получаю цену из iiko...\n\n"
-        f"Продукт: {selected_product['name']}"
+    # Получаем цену из iiko; статус показываем, только если запрос затянулся
+    iiko_price = await _await_with_progress(
+        _fetch_iiko_price(selected_product.name),
+        lambda: query.edit_message_text(
+            f"⏳ Получаю цену из iiko...\n\n"
+            f"Продукт: {selected_product.name}"
+        ),
     )
     
-    # Получаем цену из iiko
-    try:
-        async with iiko_service.session() as token:
-            price_data = await iiko_service.get_product_price_auto(
-                token=token,
-                product_name=selected_product["name"],
-            )
-        
-        if price_data:
-            iiko_price = price_data.avg_price
-            logger.info(f"Получена цена: {iiko_price} руб.")
-        else:
-            iiko_price = 0.0
-            logger.warning(f"Цена не найдена для: {selected_product['name']}")
-            
-    except Exception as e:
-        logger.error(f"Ошибка получения цены: {e}", exc_info=True)
-        iiko_price = 0.0
-    
     context.user_data["iiko_price"] = iiko_price
     
     # Показываем итоги и просим подтверждение
-    selected_request = context.user_data.get("selected_request", {})
-    supplier_price = selected_request.get("price", "?")
+    selected_request = context.user_data.get("selected_request")
+    if not selected_request:
+        await _safe_edit(query, "❌ Заявка не найдена.")
+        return ConversationHandler.END
+    
+    supplier_price = selected_request.price
     
     # Сравнение цен
     price_diff = ""
-    if iiko_price > 0:
-        try:
-            supplier_price_float = float(str(supplier_price).replace(",", ".").replace(" ", ""))
-            diff = ((supplier_price_float - iiko_price) / iiko_price) * 100
-            if diff > 0:
-                price_diff = f"📈 Дороже на {diff:.1f}%"
-            elif diff < 0:
-                price_diff = f"📉 Дешевле на {abs(diff):.1f}%"
-            else:
-                price_diff = "➡️ Цена равна"
-        except (ValueError, ZeroDivisionError):
-            price_diff = ""
-    
-    keyboard = [
-        [InlineKeyboardButton("✅ Создать акт", callback_data="dev:confirm_create")],
-        [InlineKeyboardButton("🔄 Выбрать другой продукт", callback_data="dev:manual_search")],
-        [InlineKeyboardButton("❌ Отмена", callback_data="dev:cancel")],
-    ]
+    supplier_price_float = _parse_price(supplier_price)
+    if supplier_price_float is not None and iiko_price > 0:
+        diff = ((supplier_price_float - iiko_price) / iiko_price) * 100
+        sign = (diff > 0) - (diff < 0)  # 1, 0 или -1 → индекс в _PRICE_DIFF_TMPL
+        price_diff = _PRICE_DIFF_TMPL[sign].format(abs(diff))
+    
+    text = _ACT_SUMMARY_TMPL.format(
+        request_id=selected_request.request_id,
+        supplier_name=selected_request.supplier_name,
+        nomenclature=selected_request.nomenclature,
+        supplier_price=supplier_price,
+        product_name=selected_product.name,
+        iiko_price=iiko_price,
+        price_diff=f" {price_diff}" if price_diff else "",
+    )
     
-    await query.edit_message_text(
-        f"📋 <b>Сводка для создания акта</b>\n\n"
-        f"<b>Заявка:</b> {selected_request.get('request_id', '?')}\n"
-        f"<b>Поставщик:</b> {selected_request.get('supplier_name', '?')}\n"
-        f"<b>Товар поставщика:</b> {selected_request.get('nomenclature', '?')}\n"
-        f"<b>Цена поставщика:</b> {supplier_price} руб.\n\n"
-        f"<b>Продукт iiko:</b> {selected_product['name']}\n"
-        f"<b>Цена iiko:</b> {iiko_price:.2f} руб. {price_diff}\n\n"
-        f"Создать акт проработки?",
+    await _safe_edit(
+        query,
+        text,
         parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_ACT_CONFIRM_MARKUP,
     )
     
     return DEV_CONFIRM
 
 
+async def _fetch_iiko_price(product_name: str) -> float:
+    """Средняя цена продукта из iiko; 0.0, если цена не найдена или iiko недоступен."""
+    try:
+        async with iiko_service.session() as token:
+            price_data = await iiko_service.get_product_price_auto(
+                token=token,
+                product_name=product_name,
+            )
+        
+        if price_data:
+            logger.info(f"Получена цена: {price_data.avg_price} руб.")
+            return price_data.avg_price
+        
+        logger.warning(f"Цена не найдена для: {product_name}")
+    except Exception as e:
+        logger.error(f"Ошибка получения цены: {e}", exc_info=True)
+    return 0.0
+
+
+@_cleanup_on_end
 async def confirm_create_act(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Подтверждение и создание акта."""
+    """Подтверждение создания акта: проверяем данные и запускаем создание в фоне."""
     query = update.callback_query
     await query.answer()
     
     user = update.effective_user
-    logger.info(f"confirm_create_act: user={user.username or user.id}")
-    
-    await query.edit_message_text("⏳ Создаю акт проработки...")
+    user_id = user.id
+    username = user.username
+    logger.info(f"confirm_create_act: user={username or user_id}")
     
-    selected_request = context.user_data.get("selected_request", {})
-    selected_product = context.user_data.get("selected_product", {})
+    selected_request = context.user_data.get("selected_request")
+    selected_product = context.user_data.get("selected_product")
     iiko_price = context.user_data.get("iiko_price", 0.0)
     company_info = context.user_data.get("company_info", {})
     
-    try:
-        # 1. Извлекаем folder_id из ссылки на папку заявки
-        folder_link = selected_request.get("folder_link", "")
-        folder_id = _extract_folder_id(folder_link)
-        
-        if not folder_id:
-            logger.error(f"Не удалось извлечь folder_id из: {folder_link}")
-            await query.edit_message_text(
-                "❌ Ошибка: не найдена папка заявки на Google Drive."
-            )
-            return ConversationHandler.END
-        
-        # 2. Генерируем акт (копирование шаблона Google Sheets + заполнение)
-        import asyncio
-        
-        # Подготовка данных для акта
-        user_name = f"@{user.username}" if user.username else user.full_name or str(user.id)
-        price_from_partner = selected_request.get("price", 0.0)
-        certificate_link = selected_request.get("certificate_link", "")
-        ocr_link = selected_request.get("ocr_link", "")
-        
-        # Период расчёта цены (7 дней по умолчанию)
-        from datetime import datetime, timedelta
-        date_to = datetime.now()
-        date_from = date_to - timedelta(days=7)
-        period_from_iiko = f"{date_from.strftime('%d.%m.%Y')} - {date_to.strftime('%d.%m.%Y')}"
-        
-        act_file_id = await asyncio.to_thread(
-            generate_act_for_request,
-            selected_request.get("request_id", "REQ-?????"),
-            selected_request.get("nomenclature", ""),
-            selected_request.get("supplier_name", ""),
-            selected_product.get("name", ""),
-            folder_id,
-            user_name=user_name,
-            certificate_link=certificate_link,
-            ocr_link=ocr_link,
-            price_from_partner=price_from_partner,
-            price_from_iiko=iiko_price,
-            period_from_iiko=period_from_iiko,
-        )
-        
-        if not act_file_id:
-            logger.error("Не удалось создать акт")
-            await query.edit_message_text("❌ Ошибка создания акта проработки.")
-            return ConversationHandler.END
-        
-        act_link = get_spreadsheet_link(act_file_id)
-        logger.info(f"Акт создан: {act_link}")
-        
-        # 4. Обновляем реестр
-        taken_by = f"@{user.username}" if user.username else str(user.id)
-        
-        success = await google_sheets_service.update_development_request_for_work(
-            sheet_id=company_info.get("sheet_id", ""),
-            row_number=selected_request.get("row_number", 0),
-            taken_by=taken_by,
-            iiko_name=selected_product.get("name", ""),
-            iiko_price=iiko_price,
-            act_link=act_link or "",
-        )
-        
-        if not success:
-            logger.error("Не удалось обновить реестр")
-        
-        # 5. Отправляем результат пользователю
-        await query.edit_message_text(
-            f"✅ <b>Акт проработки создан!</b>\n\n"
-            f"📋 Заявка: {selected_request.get('request_id')}\n"
-            f"📦 Товар: {selected_request.get('nomenclature')}\n"
-            f"🔗 Продукт iiko: {selected_product.get('name')}\n"
-            f"💰 Цена iiko: {iiko_price:.2f} руб.\n\n"
-            f"📎 <a href='{act_link}'>Открыть акт</a>\n\n"
-            f"<i>Во время проработки загрузите фото и укажите результат "
-            f"через меню «Мои заявки в работе».</i>",
-            parse_mode="HTML",
-            disable_web_page_preview=True,
-        )
-        
-        # Очищаем данные
-        _cleanup_context(context)
-        
+    if not selected_request or not selected_product:
+        await _safe_edit(query, "❌ Заявка или продукт не выбраны.")
         return ConversationHandler.END
-        
-    except Exception as e:
-        logger.error(f"Ошибка создания акта: {e}", exc_info=True)
-        await query.edit_message_text(
-            f"❌ Ошибка при создании акта:\n{str(e)[:200]}"
+    
+    # 1. Извлекаем folder_id из ссылки на папку заявки
+    folder_link = selected_request.folder_link
+    folder_id = _extract_folder_id(folder_link)
+    
+    if not folder_id:
+        logger.error(f"Не удалось извлечь folder_id из: {folder_link}")
+        await _safe_edit(
+            query,
+            "❌ Ошибка: не найдена папка заявки на Google Drive."
         )
         return ConversationHandler.END
+    
+    # Заявка занята с этого момента и до обновления реестра в фоновой задаче
+    sheet_id = company_info.get("sheet_id", "")
+    in_progress_key = (sheet_id, selected_request.row_number)
+    if in_progress_key in _ACTS_IN_PROGRESS:
+        await _safe_edit(query, "⏳ Акт по этой заявке уже создаётся.")
+        return ConversationHandler.END
+    _ACTS_IN_PROGRESS.add(in_progress_key)
+    
+    # 2. Создание акта (копирование шаблона Google Sheets + заполнение) идёт в фоне:
+    # хэндлер сразу освобождается, результат придёт правкой этого же сообщения.
+    # application.create_task держит ссылку на задачу до завершения.
+    try:
+        await _safe_edit(query, "⏳ Создаю акт проработки...")
+    except Exception:
+        _ACTS_IN_PROGRESS.discard(in_progress_key)
+        raise
+    context.application.create_task(
+        _create_act(
+            query,
+            selected_request,
+            product_name=selected_product.name,
+            iiko_price=iiko_price,
+            folder_id=folder_id,
+            sheet_id=sheet_id,
+            user_name=f"@{username}" if username else user.full_name or str(user_id),
+            taken_by=f"@{username}" if username else str(user_id),
+        ),
+        update=update,
+    )
+    
+    # Данные очистит _cleanup_on_end — всё нужное уже передано в задачу
+    return ConversationHandler.END
+
+
+async def _create_act(
+    query: CallbackQuery,
+    request: DevRequest,
+    *,
+    product_name: str,
+    iiko_price: float,
+    folder_id: str,
+    sheet_id: str,
+    user_name: str,
+    taken_by: str,
+) -> None:
+    """Фоновое создание акта проработки и обновление реестра.
+    
+    Задачи одного чата выполняются по очереди (_chat_queue). Заявка снимается
+    с _ACTS_IN_PROGRESS после обновления реестра или ошибки.
+    """
+    # Поля заявки читаем один раз
+    request_id = request.request_id
+    nomenclature = request.nomenclature
+    
+    try:
+        async with _chat_queue(query.message.chat.id):
+            try:
+                # Период расчёта цены (7 дней по умолчанию)
+                date_to = datetime.now()
+                date_from = date_to - timedelta(days=7)
+                period_from_iiko = f"{date_from.strftime('%d.%m.%Y')} - {date_to.strftime('%d.%m.%Y')}"
+                
+                loop = asyncio.get_running_loop()
+                act_file_id = await loop.run_in_executor(_ACT_EXECUTOR, partial(
+                    generate_act_for_request,
+                    request_id,
+                    nomenclature,
+                    request.supplier_name,
+                    product_name,
+                    folder_id,
+                    user_name=user_name,
+                    certificate_link=request.certificate_link,
+                    ocr_link=request.ocr_link,
+                    price_from_partner=request.price,
+                    price_from_iiko=iiko_price,
+                    period_from_iiko=period_from_iiko,
+                ))
+                
+                if not act_file_id:
+                    logger.error("Не удалось создать акт")
+                    await _safe_edit(query, "❌ Ошибка создания акта проработки.")
+                    return
+                
+                act_link = get_spreadsheet_link(act_file_id)
+                logger.info(f"Акт создан: {act_link}")
+                
+                # 3. Отправляем результат пользователю (ссылка на акт уже есть)
+                lines = [
+                    "✅ <b>Акт проработки создан!</b>",
+                    "",
+                    f"📋 Заявка: {request_id}",
+                    f"📦 Товар: {nomenclature}",
+                    f"🔗 Продукт iiko: {product_name}",
+                    f"💰 Цена iiko: {iiko_price:.2f} руб.",
+                    "",
+                    f"📎 <a href='{act_link}'>Открыть акт</a>",
+                    "",
+                    "<i>Во время проработки загрузите фото и укажите результат "
+                    "через меню «Мои заявки в работе».</i>",
+                ]
+                await _safe_edit(
+                    query,
+                    "\n".join(lines),
+                    parse_mode="HTML",
+                    disable_web_page_preview=True,
+                )
+            
+            except Exception as e:
+                logger.error(f"Ошибка создания акта: {e}", exc_info=True)
+                try:
+                    await _safe_edit(
+                        query,
+                        f"❌ Ошибка при создании акта:\n{str(e)[:200]}"
+                    )
+                except Exception as edit_error:
+                    logger.warning(f"Не удалось сообщить об ошибке: {edit_error}")
+                return
+            
+            # 4. Обновляем реестр — пользователь ответ уже получил
+            await _update_registry_for_work(
+                sheet_id=sheet_id,
+                row_number=request.row_number,
+                taken_by=taken_by,
+                iiko_name=product_name,
+                iiko_price=iiko_price,
+                act_link=act_link or "",
+            )
+    finally:
+        _ACTS_IN_PROGRESS.discard((sheet_id, request.row_number))
 
 
+async def _update_registry_for_work(**kwargs: Any) -> None:
+    """Обновление реестра после создания акта (ошибки только логируются)."""
+    try:
+        success = await google_sheets_service.update_development_request_for_work(**kwargs)
+    except Exception as e:
+        logger.error(f"Ошибка фонового обновления реестра: {e}", exc_info=True)
+        return
+    
+    if not success:
+        logger.error("Не удалось обновить реестр")
+
+
+@_cleanup_on_end
 async def my_requests_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Показать заявки пользователя в работе (из меню проработки)."""
     query = update.callback_query
@@ -473,6 +766,7 @@ async def my_requests_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     return await _show_user_requests(update, context, is_callback=True)
 
 
+@_cleanup_on_end
 async def start_my_requests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Точка входа для кнопки '📋 Заявки в работе' из главного меню."""
     logger.info(f"start_my_requests: user_id={update.effective_user.id}")
@@ -487,19 +781,19 @@ async def _show_user_requests(
     """Общая логика показа заявок пользователя в работе."""
     user = update.effective_user
     user_id = user.id
+    tg_username = user.username
     
     # Определяем username
-    username = f"@{user.username}" if user.username else user.full_name or str(user_id)
+    username = f"@{tg_username}" if tg_username else user.full_name or str(user_id)
     
     # Получаем информацию о компании
-    company_info = await get_user_company_info(user_id)
+    company_info = await get_user_company_info_cached(user_id)
     if not company_info:
-        msg = "❌ Вы не привязаны к компании. Используйте /start для регистрации."
         if is_callback:
-            await update.callback_query.edit_message_text(msg)
+            await _safe_edit(update.callback_query, _NO_COMPANY_MSG)
         else:
             is_superadmin = user_id in SUPERADMIN_IDS
-            await update.message.reply_text(msg, reply_markup=get_main_menu_keyboard(is_superadmin))
+            await update.message.reply_text(_NO_COMPANY_MSG, reply_markup=get_main_menu_keyboard(is_superadmin))
         return ConversationHandler.END
     
     context.user_data["complete_company_info"] = {
@@ -515,48 +809,35 @@ async def _show_user_requests(
     )
     
     if not requests:
-        msg = (
-            "📭 <b>Нет активных заявок</b>\n\n"
-            "У вас нет заявок в работе.\n"
-            "Сначала выберите заявку через меню «Проработки (Заявки)» → «Выбрать заявку»."
-        )
         if is_callback:
-            await update.callback_query.edit_message_text(msg, parse_mode="HTML")
+            await _safe_edit(update.callback_query, _NO_ACTIVE_REQUESTS_MSG, parse_mode="HTML")
         else:
             is_superadmin = user_id in SUPERADMIN_IDS
-            await update.message.reply_text(msg, parse_mode="HTML", reply_markup=get_main_menu_keyboard(is_superadmin))
+            await update.message.reply_text(_NO_ACTIVE_REQUESTS_MSG, parse_mode="HTML", reply_markup=get_main_menu_keyboard(is_superadmin))
         return ConversationHandler.END
     
     # Сохраняем заявки
-    context.user_data["complete_requests"] = requests
+    _dev_cache(context)["complete_requests"] = requests
     
     # Формируем клавиатуру
-    keyboard = []
-    for req in requests[:10]:
-        label = f"{req['request_id']} | {req['supplier_name'][:15]} | {req['nomenclature'][:15]}"
-        keyboard.append([
-            InlineKeyboardButton(label, callback_data=f"compl:req:{req['row_number']}")
-        ])
-    
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="compl:cancel")])
-    
-    msg = (
-        f"📋 <b>Заявки в работе</b> ({len(requests)} шт)\n\n"
-        "Выберите заявку для завершения:"
-    )
+    keyboard = [
+        [InlineKeyboardButton(req["label"], callback_data=f"compl:req:{req['row_number']}")]
+        for req in islice(requests, MAX_VISIBLE_REQUESTS)
+    ]
+    keyboard.append(_CANCEL_ROW_COMPL)
     
+    msg = _IN_PROGRESS_REQUESTS_TMPL.format(total=len(requests))
+    
+    markup = InlineKeyboardMarkup(keyboard)
     if is_callback:
-        await update.callback_query.edit_message_text(
-            msg, parse_mode="HTML", reply_markup=InlineKeyboardMarkup(keyboard)
-        )
+        await _safe_edit(update.callback_query, msg, parse_mode="HTML", reply_markup=markup)
     else:
-        await update.message.reply_text(
-            msg, parse_mode="HTML", reply_markup=InlineKeyboardMarkup(keyboard)
-        )
+        await update.message.reply_text(msg, parse_mode="HTML", reply_markup=markup)
     
     return COMPLETE_SELECT_REQUEST
 
 
+@_cleanup_on_end
 async def complete_request_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Пользователь выбрал заявку для завершения."""
     query = update.callback_query
@@ -565,8 +846,9 @@ async def complete_request_selected(update: Update, context: ContextTypes.DEFAUL
     data = query.data
     logger.debug(f"complete_request_selected: data={data}")
     
-    row_number = int(data.split(":")[2])
-    requests = context.user_data.get("complete_requests", [])
+    # Формат compl:req:<row> уже проверен паттерном хэндлера
+    row_number = int(data.rpartition(":")[2])
+    requests = _dev_cache(context).get("complete_requests", [])
     
     selected = None
     for req in requests:
@@ -575,11 +857,12 @@ async def complete_request_selected(update: Update, context: ContextTypes.DEFAUL
             break
     
     if not selected:
-        await query.edit_message_text("❌ Заявка не найдена.")
+        await _safe_edit(query, "❌ Заявка не найдена.")
         return ConversationHandler.END
     
     context.user_data["complete_selected"] = selected
     context.user_data["complete_photos"] = []  # Список загруженных фото
+    _PENDING_UPLOADS.pop(update.effective_user.id, None)
     
     # Извлекаем act_id из ссылки на акт
     act_link = selected.get("act_link", "")
@@ -591,28 +874,23 @@ async def complete_request_selected(update: Update, context: ContextTypes.DEFAUL
     folder_id = _extract_folder_id(folder_link)
     context.user_data["complete_folder_id"] = folder_id
     
-    keyboard = [[InlineKeyboardButton("✅ Завершить загрузку фото", callback_data="compl:photos_done")]]
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="compl:cancel")])
-    
-    await query.edit_message_text(
+    await _safe_edit(
+        query,
         f"📸 <b>Загрузка фото проработки</b>\n\n"
         f"📦 Заявка: {selected['request_id']}\n"
         f"📋 Товар: {selected['nomenclature']}\n\n"
         "Отправьте фотографии проработки (можно несколько).\n"
         "Когда закончите — нажмите «Завершить загрузку фото».",
         parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_PHOTOS_START_MARKUP,
     )
     
     return COMPLETE_UPLOAD_PHOTOS
 
 
+@_cleanup_on_end
 async def complete_photo_uploaded(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Пользователь загрузил фото."""
-    import asyncio
-    import tempfile
-    from pathlib import Path
-    
+    """Пользователь загрузил фото — загрузка в Drive запускается в фоне."""
     photo = update.message.photo[-1] if update.message.photo else None
     document = update.message.document if update.message.document else None
     
@@ -625,63 +903,86 @@ async def complete_photo_uploaded(update: Update, context: ContextTypes.DEFAULT_
         await update.message.reply_text("❌ Ошибка: не найдена папка для загрузки.")
         return COMPLETE_UPLOAD_PHOTOS
     
-    # Скачиваем файл
+    # Задачи храним вне user_data: она сохраняется через persistence, а Task не сериализуется
+    pending = _PENDING_UPLOADS.setdefault(update.effective_user.id, [])
+    number = len(context.user_data.get("complete_photos", [])) + len(pending) + 1
+    
     if photo:
-        file = await photo.get_file()  # photo — это PhotoSize, не tuple
-        filename = f"photo_{len(context.user_data.get('complete_photos', [])) + 1}.jpg"
+        filename = f"photo_{number}.jpg"
+        media = photo  # photo — это PhotoSize, не tuple
     else:
-        file = await document.get_file()
-        filename = document.file_name or f"file_{len(context.user_data.get('complete_photos', [])) + 1}"
+        filename = document.file_name or f"file_{number}"
+        media = document
+    
+    # Фото из альбома приходят отдельными апдейтами — их загрузки идут параллельно,
+    # а complete_photos_done дожидается всех
+    pending.append(context.application.create_task(
+        _upload_photo(media, folder_id, filename),
+        update=update,
+    ))
+    
+    # Показываем, сколько фото принято; загружено ли — станет известно в complete_photos_done
+    keyboard = [
+        [InlineKeyboardButton(f"✅ Завершить загрузку (принято {number} фото)", callback_data="compl:photos_done")],
+        _CANCEL_ROW_COMPL,
+    ]
     
-    # Сохраняем во временный файл
-    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(filename).suffix) as tmp:
-        await file.download_to_drive(tmp.name)
-        tmp_path = Path(tmp.name)  # Path, не str!
+    await update.message.reply_text(
+        f"📸 Принято фото: {number}\n\n"
+        "Отправьте ещё фото или нажмите «Завершить загрузку».",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+    )
     
+    return COMPLETE_UPLOAD_PHOTOS
+
+
+async def _upload_photo(media: PhotoSize | Document, folder_id: str, filename: str) -> tuple[str, str | None]:
+    """Скачать файл из Telegram в память и загрузить в Google Drive.
+    
+    Returns:
+        (имя файла, ссылка) — ссылка None, если загрузка не удалась
+    """
     try:
-        # Загружаем в Google Drive
-        # Сигнатура: upload_file_to_drive(file_path, folder_id, filename, mime_type, make_public)
+        file = await media.get_file()
+        data = await file.download_as_bytearray()
+        
+        # Сигнатура: upload_bytes_to_drive(data, folder_id, filename, mime_type, make_public)
         file_id = await asyncio.to_thread(
-            upload_file_to_drive,
-            tmp_path,
+            upload_bytes_to_drive,
+            data,
             folder_id,
             filename,
             "image/jpeg",  # mime_type
             True,  # make_public — для IMAGE() в Sheets
         )
-        
-        if file_id:
-            link = get_file_link(file_id)
-            context.user_data.setdefault("complete_photos", []).append((filename, link))
-            logger.info(f"Фото загружено: {filename} -> {link}")
-        else:
-            await update.message.reply_text(f"⚠️ Не удалось загрузить {filename}")
-    finally:
-        # Удаляем временный файл
-        tmp_path.unlink(missing_ok=True)
-    
-    # Показываем текущее количество фото
-    photos_count = len(context.user_data.get("complete_photos", []))
-    keyboard = [[InlineKeyboardButton(f"✅ Завершить загрузку ({photos_count} фото)", callback_data="compl:photos_done")]]
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="compl:cancel")])
+    except Exception as e:
+        logger.error(f"Ошибка загрузки {filename}: {e}", exc_info=True)
+        return filename, None
     
-    await update.message.reply_text(
-        f"📸 Загружено фото: {photos_count}\n\n"
-        "Отправьте ещё фото или нажмите «Завершить загрузку».",
-        reply_markup=InlineKeyboardMarkup(keyboard),
-    )
+    if not file_id:
+        return filename, None
     
-    return COMPLETE_UPLOAD_PHOTOS
+    link = get_file_link(file_id)
+    logger.info(f"Фото загружено: {filename} -> {link}")
+    return filename, link
 
 
+@_cleanup_on_end
 async def complete_photos_done(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Пользователь завершил загрузку фото."""
-    import asyncio
-    
     query = update.callback_query
     await query.answer()
     
-    photos = context.user_data.get("complete_photos", [])
+    # Дожидаемся фоновых загрузок (порядок — как фото были отправлены)
+    pending = _PENDING_UPLOADS.pop(update.effective_user.id, [])
+    photos = context.user_data.setdefault("complete_photos", [])
+    failed = []
+    for filename, link in await asyncio.gather(*pending):
+        if link:
+            photos.append((filename, link))
+        else:
+            failed.append(filename)
+    
     act_id = context.user_data.get("complete_act_id")
     
     # Добавляем фото в акт
@@ -690,23 +991,22 @@ async def complete_photos_done(update: Update, context: ContextTypes.DEFAULT_TYP
         logger.info(f"Добавлено {len(photos)} фото в акт {act_id}")
     
     # Спрашиваем результат
-    keyboard = [
-        [InlineKeyboardButton("✅ Подходит", callback_data="compl:result:yes")],
-        [InlineKeyboardButton("❌ Не подходит", callback_data="compl:result:no")],
-        [InlineKeyboardButton("❌ Отмена", callback_data="compl:cancel")],
-    ]
+    failed_text = f"⚠️ Не удалось загрузить: {', '.join(failed)}\n\n" if failed else ""
     
-    await query.edit_message_text(
+    await _safe_edit(
+        query,
         "📊 <b>Результат проработки</b>\n\n"
         f"Загружено фото: {len(photos)}\n\n"
+        f"{failed_text}"
         "Продукт подходит для закупки?",
         parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_RESULT_MARKUP,
     )
     
     return COMPLETE_RESULT
 
 
+@_cleanup_on_end
 async def complete_result_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Пользователь выбрал результат (подходит/не подходит)."""
     query = update.callback_query
@@ -716,22 +1016,19 @@ async def complete_result_selected(update: Update, context: ContextTypes.DEFAULT
     result = "Подходит" if data == "compl:result:yes" else "Не подходит"
     context.user_data["complete_result"] = result
     
-    keyboard = [
-        [InlineKeyboardButton("➡️ Пропустить", callback_data="compl:comment:skip")],
-        [InlineKeyboardButton("❌ Отмена", callback_data="compl:cancel")],
-    ]
-    
-    await query.edit_message_text(
+    await _safe_edit(
+        query,
         f"📝 <b>Комментарий</b>\n\n"
         f"Результат: {result}\n\n"
         "Введите комментарий (или нажмите «Пропустить»):",
         parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_COMMENT_MARKUP,
     )
     
     return COMPLETE_COMMENT
 
 
+@_cleanup_on_end
 async def complete_comment_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Пользователь ввёл комментарий."""
     comment = update.message.text.strip()
@@ -740,6 +1037,7 @@ async def complete_comment_received(update: Update, context: ContextTypes.DEFAUL
     return await _ask_mass_prorabotka_or_finish(update, context, is_message=True)
 
 
+@_cleanup_on_end
 async def complete_comment_skipped(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Пользователь пропустил комментарий."""
     query = update.callback_query
@@ -759,21 +1057,15 @@ async def _ask_mass_prorabotka_or_finish(
     result = context.user_data.get("complete_result", "")
     
     if result == "Подходит":
-        keyboard = [
-            [InlineKeyboardButton("✅ Да", callback_data="compl:mass:yes")],
-            [InlineKeyboardButton("❌ Нет", callback_data="compl:mass:no")],
-            [InlineKeyboardButton("❌ Отмена", callback_data="compl:cancel")],
-        ]
-        
         msg = (
             "🔄 <b>Массовая проработка</b>\n\n"
             "Нужна ли массовая проработка этого продукта?"
         )
         
         if is_message:
-            await update.message.reply_text(msg, parse_mode="HTML", reply_markup=InlineKeyboardMarkup(keyboard))
+            await update.message.reply_text(msg, parse_mode="HTML", reply_markup=_MASS_MARKUP)
         else:
-            await update.callback_query.edit_message_text(msg, parse_mode="HTML", reply_markup=InlineKeyboardMarkup(keyboard))
+            await _safe_edit(update.callback_query, msg, parse_mode="HTML", reply_markup=_MASS_MARKUP)
         
         return COMPLETE_MASS_PRORABOTKA
     else:
@@ -782,6 +1074,7 @@ async def _ask_mass_prorabotka_or_finish(
         return await _show_complete_confirmation(update, context, is_message)
 
 
+@_cleanup_on_end
 async def complete_mass_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Пользователь выбрал массовую проработку."""
     query = update.callback_query
@@ -800,126 +1093,122 @@ async def _show_complete_confirmation(
     is_message: bool = False
 ) -> int:
     """Показать подтверждение завершения."""
-    import asyncio
-    
-    selected = context.user_data.get("complete_selected", {})
-    result = context.user_data.get("complete_result", "")
-    comment = context.user_data.get("complete_comment", "")
-    mass = context.user_data.get("complete_mass_prorabotka", "")
-    photos_count = len(context.user_data.get("complete_photos", []))
-    act_id = context.user_data.get("complete_act_id")
+    user_data = context.user_data
+    selected = user_data.get("complete_selected") or {}
+    result = user_data.get("complete_result", "")
+    comment = user_data.get("complete_comment", "")
+    mass = user_data.get("complete_mass_prorabotka", "")
+    photos_count = len(user_data.get("complete_photos", ()))
+    act_id = user_data.get("complete_act_id")
     
     # Читаем вес из ячейки C24 акта
     weight = ""
     if act_id:
         weight = await asyncio.to_thread(get_act_cell_value, act_id, "C24")
-    context.user_data["complete_weight"] = weight
+    user_data["complete_weight"] = weight
     
     full_result = f"{result}: {comment}" if comment else result
     
-    keyboard = [
-        [InlineKeyboardButton("✅ Подтвердить и завершить", callback_data="compl:finish")],
-        [InlineKeyboardButton("❌ Отмена", callback_data="compl:cancel")],
-    ]
-    
-    msg = (
-        f"📋 <b>Подтверждение завершения</b>\n\n"
-        f"📦 Заявка: {selected.get('request_id', '')}\n"
-        f"📋 Товар: {selected.get('nomenclature', '')}\n"
-        f"📸 Фото: {photos_count}\n"
-        f"📊 Результат: {full_result}\n"
-    )
-    
-    if mass:
-        msg += f"🔄 Массовая проработка: {mass}\n"
-    
-    if weight:
-        msg += f"⚖️ Вес с этикетки: {weight}\n"
-    
-    msg += "\nНажмите «Подтвердить» для завершения."
+    # Недостающие поля заявки подставляются пустой строкой
+    msg = _COMPLETE_CONFIRM_TMPL.format_map(_BlankDict(
+        selected,
+        photos_count=photos_count,
+        full_result=full_result,
+        mass_line=f"🔄 Массовая проработка: {mass}\n" if mass else "",
+        weight_line=f"⚖️ Вес с этикетки: {weight}\n" if weight else "",
+    ))
     
     if is_message:
-        await update.message.reply_text(msg, parse_mode="HTML", reply_markup=InlineKeyboardMarkup(keyboard))
+        await update.message.reply_text(msg, parse_mode="HTML", reply_markup=_FINISH_MARKUP)
     else:
-        await update.callback_query.edit_message_text(msg, parse_mode="HTML", reply_markup=InlineKeyboardMarkup(keyboard))
+        await _safe_edit(update.callback_query, msg, parse_mode="HTML", reply_markup=_FINISH_MARKUP)
     
     return COMPLETE_CONFIRM
 
 
+@_cleanup_on_end
 async def complete_finish(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Завершить проработку."""
-    import asyncio
-    
     query = update.callback_query
-    await query.answer("Завершаем...")
+    # Ответ на нажатие уходит параллельно с работой — «часики» у кнопки пропадают сразу
+    context.application.create_task(query.answer("Завершаем..."), update=update)
     
     user_id = update.effective_user.id
     is_superadmin = user_id in SUPERADMIN_IDS
     
-    selected = context.user_data.get("complete_selected", {})
-    company_info = context.user_data.get("complete_company_info", {})
-    result = context.user_data.get("complete_result", "")
-    comment = context.user_data.get("complete_comment", "")
-    mass = context.user_data.get("complete_mass_prorabotka", "")
-    weight = context.user_data.get("complete_weight", "")
-    act_id = context.user_data.get("complete_act_id")
+    # Всё нужное из контекста читаем один раз в локальные переменные
+    user_data = context.user_data
+    selected = user_data.get("complete_selected") or {}
+    result = user_data.get("complete_result", "")
+    comment = user_data.get("complete_comment", "")
+    mass = user_data.get("complete_mass_prorabotka", "")
+    weight = user_data.get("complete_weight", "")
+    act_id = user_data.get("complete_act_id")
+    sheet_id = (user_data.get("complete_company_info") or {}).get("sheet_id", "")
+    request_id = selected.get("request_id", "")
+    nomenclature = selected.get("nomenclature", "")
+    supplier_inn = selected.get("supplier_inn", "")
+    row_number = selected.get("row_number", 0)
     
     full_result = f"{result}: {comment}" if comment else result
-    sheet_id = company_info.get("sheet_id", "")
-    row_number = selected.get("row_number", 0)
     
-    # 1. Обновляем реестр
-    success = await google_sheets_service.complete_development_request(
-        sheet_id=sheet_id,
-        row_number=row_number,
-        result=full_result,
-        mass_prorabotka=mass,
-        weight_from_label=weight,
+    # Реестр, PDF акта и email поставщика друг от друга не зависят — запрашиваем параллельно
+    success, pdf_bytes, supplier_email = await asyncio.gather(
+        google_sheets_service.complete_development_request(
+            sheet_id=sheet_id,
+            row_number=row_number,
+            result=full_result,
+            mass_prorabotka=mass,
+            weight_from_label=weight,
+        ),
+        # contextvars экспорту не нужны — run_in_executor без копирования контекста, как в to_thread
+        (
+            asyncio.get_running_loop().run_in_executor(_ACT_EXECUTOR, export_act_to_pdf, act_id)
+            if act_id else _resolved(None)
+        ),
+        # Без ИНН искать email бессмысленно — запрос к реестру поставщиков не делаем
+        (
+            google_sheets_service.get_supplier_email_by_inn(sheet_id, supplier_inn)
+            if supplier_inn else _resolved(None)
+        ),
     )
     
     if not success:
-        await query.edit_message_text("❌ Ошибка обновления реестра. Попробуйте позже.")
-        _cleanup_complete_context(context)
+        await _safe_edit(query, "❌ Ошибка обновления реестра. Попробуйте позже.")
         return ConversationHandler.END
     
-    # 2. Экспортируем PDF
-    pdf_bytes = None
-    if act_id:
-        pdf_bytes = await asyncio.to_thread(export_act_to_pdf, act_id)
-    
-    # 3. Отправляем email поставщику
-    supplier_inn = selected.get("supplier_inn", "")
-    supplier_email = await google_sheets_service.get_supplier_email_by_inn(sheet_id, supplier_inn)
-    
-    email_sent = False
-    if supplier_email and pdf_bytes:
-        email_sent = await _send_completion_email(
-            to_email=supplier_email,
-            selected=selected,
-            result=full_result,
-            mass=mass,
-            pdf_bytes=pdf_bytes,
+    # Письмо поставщику отправляется в фоне — SMTP не задерживает ответ пользователю
+    email_queued = bool(supplier_email and pdf_bytes)
+    if email_queued:
+        context.application.create_task(
+            _send_completion_email_and_notify(
+                query,
+                to_email=supplier_email,
+                selected=selected,
+                result=full_result,
+                mass=mass,
+                pdf_bytes=pdf_bytes,
+            ),
+            update=update,
         )
     
-    # Формируем итоговое сообщение
-    msg = (
-        f"✅ <b>Проработка завершена!</b>\n\n"
-        f"📦 Заявка: {selected.get('request_id', '')}\n"
-        f"📋 Товар: {selected.get('nomenclature', '')}\n"
-        f"📊 Результат: {full_result}\n"
-    )
-    
-    if mass:
-        msg += f"🔄 Массовая проработка: {mass}\n"
-    
-    if email_sent:
-        msg += f"\n📧 Email отправлен на {supplier_email}"
+    if email_queued:
+        email_line = f"📧 Email отправляется на {supplier_email}"
     elif supplier_email:
-        msg += f"\n⚠️ Не удалось отправить email на {supplier_email}"
+        email_line = f"⚠️ Не удалось отправить email на {supplier_email}"
     else:
-        msg += "\n⚠️ Email поставщика не найден"
+        email_line = "⚠️ Email поставщика не найден"
+    
+    # Формируем итоговое сообщение
+    msg = _COMPLETE_DONE_TMPL.format(
+        request_id=request_id,
+        nomenclature=nomenclature,
+        full_result=full_result,
+        mass_line=f"🔄 Массовая проработка: {mass}\n" if mass else "",
+        email_line=email_line,
+    )
     
-    await query.edit_message_text(msg, parse_mode="HTML")
+    await _safe_edit(query, msg, parse_mode="HTML")
     
     # Показываем главное меню
     await query.message.reply_text(
@@ -927,10 +1216,23 @@ async def complete_finish(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         reply_markup=get_main_menu_keyboard(is_superadmin),
     )
     
-    _cleanup_complete_context(context)
     return ConversationHandler.END
 
 
+async def _send_completion_email_and_notify(query: CallbackQuery, to_email: str, **kwargs: Any) -> None:
+    """Фоновая отправка email о завершении; о неудаче пользователь узнаёт отдельным сообщением."""
+    try:
+        sent = await _send_completion_email(to_email=to_email, **kwargs)
+    except Exception as e:
+        logger.error(f"Ошибка отправки email на {to_email}: {e}", exc_info=True)
+        sent = False
+    
+    if sent:
+        logger.info(f"Email о завершении проработки отправлен на {to_email}")
+    else:
+        await query.message.reply_text(f"⚠️ Не удалось отправить email на {to_email}")
+
+
 async def _send_completion_email(
     to_email: str,
     selected: dict,
@@ -939,33 +1241,21 @@ async def _send_completion_email(
     pdf_bytes: bytes,
 ) -> bool:
     """Отправить email о завершении проработки."""
-    from bot.services.email_service import send_email, EmailMessage, DEFAULT_CC
-    
     subject = f"Результат проработки: {selected.get('nomenclature', 'Товар')}"
     
-    body = f"""Результат проработки продукта
-
-Заявка: {selected.get('request_id', '')}
-Товар: {selected.get('nomenclature', '')}
-Поставщик: {selected.get('supplier_name', '')}
-Результат: {result}
-"""
-    
-    if mass:
-        body += f"Массовая проработка: {mass}\n"
-    
-    body += """
-Акт проработки прикреплён к письму.
-
-С уважением,
-WorkFlow Hub
-"""
+    body = _COMPLETION_EMAIL_TMPL.format(
+        request_id=selected.get("request_id", ""),
+        nomenclature=selected.get("nomenclature", ""),
+        supplier_name=selected.get("supplier_name", ""),
+        result=result,
+        mass_line=f"Массовая проработка: {mass}\n" if mass else "",
+    )
     
     # Формируем вложение
     attachments = [
         {
             "filename": f"Акт_проработки_{selected.get('request_id', 'XXX')}.pdf",
-            "content": pdf_bytes,
+            "stream": io.BytesIO(pdf_bytes),
             "content_type": "application/pdf",
         }
     ]
@@ -987,43 +1277,26 @@ def _extract_file_id_from_act_link(link: str) -> str | None:
         return None
     
     # https://docs.google.com/spreadsheets/d/FILE_ID/edit
-    patterns = [
-        r"/d/([a-zA-Z0-9_-]+)",
-        r"id=([a-zA-Z0-9_-]+)",
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, link)
-        if match:
-            return match.group(1)
-    
-    return None
+    return _id_after(link, "/d/", _FILE_ID_RE) or _id_after(link, "id=", _ID_RE)
 
 
 def _cleanup_complete_context(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Очистить данные контекста завершения."""
-    keys = [
-        "complete_company_info",
-        "complete_requests",
-        "complete_selected",
-        "complete_photos",
-        "complete_act_id",
-        "complete_folder_id",
-        "complete_result",
-        "complete_comment",
-        "complete_mass_prorabotka",
-        "complete_weight",
-    ]
-    for key in keys:
-        context.user_data.pop(key, None)
+    user_data = context.user_data
+    for key in _COMPLETE_KEYS.intersection(user_data):
+        del user_data[key]
+    _drop_from_dev_cache(context, "complete_requests")
+    if context.user_id is not None:
+        _PENDING_UPLOADS.pop(context.user_id, None)
 
 
+@_cleanup_on_end
 async def complete_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отмена процесса завершения."""
     query = update.callback_query
     if query:
-        await query.answer()
-        await query.edit_message_text("❌ Завершение отменено.")
+        context.application.create_task(query.answer(), update=update)
+        await _safe_edit(query, "❌ Завершение отменено.")
     else:
         await update.message.reply_text("❌ Завершение отменено.")
     
@@ -1036,48 +1309,238 @@ async def complete_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             reply_markup=get_main_menu_keyboard(is_superadmin),
         )
     
-    _cleanup_complete_context(context)
     return ConversationHandler.END
 
 
+@_cleanup_on_end
 async def close_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Закрыть меню."""
     query = update.callback_query
     await query.answer()
     
-    await query.edit_message_text("Меню закрыто.")
-    _cleanup_context(context)
-    
+    await _safe_edit(query, "Меню закрыто.")
     return ConversationHandler.END
 
 
+@_cleanup_on_end
 async def cancel_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отмена операции."""
     query = update.callback_query
     if query:
         await query.answer()
-        await query.edit_message_text("❌ Операция отменена.")
+        await _safe_edit(query, "❌ Операция отменена.")
     else:
         await update.message.reply_text("❌ Операция отменена.")
     
-    _cleanup_context(context)
+    return ConversationHandler.END
+
+
+@_cleanup_on_end
+async def timeout_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Диалог истёк по таймауту — данные обоих этапов очищает _cleanup_on_end."""
+    user = update.effective_user
+    logger.info(f"development conversation timeout: user={user.id if user else '?'}")
     return ConversationHandler.END
 
 
 def _cleanup_context(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Очистить данные контекста."""
-    keys_to_remove = [
-        "company_info",
-        "dev_requests",
-        "selected_request",
-        "found_products",
-        "selected_product",
-        "iiko_price",
-    ]
-    for key in keys_to_remove:
-        context.user_data.pop(key, None)
+    user_data = context.user_data
+    for key in _CTX_KEYS.intersection(user_data):
+        del user_data[key]
+    _drop_from_dev_cache(context, "dev_requests_by_row", "found_products", "_dev_req_view", "_dev_prod_markup")
+
+
+async def _cached_search_products(search_query: str, limit: int) -> list[IikoProduct]:
+    """search_products с LRU/TTL-кешем по нормализованному запросу.
+    
+    Кеш сбрасывается после синхронизации iiko (по версии индекса).
+    """
+    # search_products сам приводит запрос к нижнему регистру и обрезает пробелы
+    key = (search_query.lower().strip(), limit)
+    now = time.monotonic()
+    version = search_index_version()
+    cached = _SEARCH_CACHE.pop(key, None)
+    if cached and cached[1] == version and now - cached[0] < _SEARCH_TTL:
+        _SEARCH_CACHE[key] = cached  # переносим в конец — недавно использованная запись
+        return cached[2]
+    
+    subset = _search_from_cached_subset(key[0], limit, version, now)
+    if subset is not None:
+        _SEARCH_CACHE[key] = (now, version, subset)
+        return subset
+    
+    inflight = _SEARCH_INFLIGHT.get(key)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+    
+    future = asyncio.ensure_future(search_products(key[0], limit=limit))
+    _SEARCH_INFLIGHT[key] = future
+    try:
+        results = await asyncio.shield(future)
+    finally:
+        _SEARCH_INFLIGHT.pop(key, None)
+    
+    _SEARCH_CACHE[key] = (now, version, results)
+    if len(_SEARCH_CACHE) > _SEARCH_CACHE_MAX:
+        _SEARCH_CACHE.pop(next(iter(_SEARCH_CACHE)))
+    return results
+
+
+def _search_from_cached_subset(
+    query: str, limit: int, version: int, now: float
+) -> list[IikoProduct] | None:
+    """Отфильтровать результат более короткого запроса, если он полный.
+    
+    Всё, что содержит «куриное филе», содержит и «куриное», поэтому полный
+    (не обрезанный limit) результат по «куриное» — надмножество искомого.
+    """
+    for (cached_query, cached_limit), (loaded_at, cached_version, products) in _SEARCH_CACHE.items():
+        if (
+            cached_version != version
+            or now - loaded_at >= _SEARCH_TTL
+            or len(products) >= cached_limit  # результат мог быть обрезан
+            or cached_query not in query
+        ):
+            continue
+        return [p for p in products if query in p.name.lower()][:limit]
+    return None
+
+
+async def _safe_edit(query: CallbackQuery, text: str, **kwargs: Any) -> None:
+    """edit_message_text, пропускающий заведомо пустое изменение.
+    
+    Если текст и клавиатура совпадают с текущими (например, при повторном
+    нажатии), запрос не отправляется; ответ Telegram "message is not modified"
+    не считается ошибкой.
+    """
+    message = query.message
+    if kwargs.get("reply_markup") == getattr(message, "reply_markup", None):
+        current = getattr(message, "text_html" if kwargs.get("parse_mode") == "HTML" else "text", None)
+        if current == text:
+            return
+    try:
+        await query.edit_message_text(text, **kwargs)
+    except BadRequest as e:
+        if "not modified" not in str(e):
+            raise
+
+
+async def _await_with_progress(
+    aw: Awaitable[T],
+    show_progress: Callable[[], Awaitable[Any]],
+    delay: float = PROGRESS_DELAY,
+) -> T:
+    """Дождаться результата; сообщение о прогрессе отправить, только если ждём дольше delay.
+    
+    Быстрые операции (кеш iiko) обходятся одним edit_message_text вместо двух.
+    """
+    task = asyncio.ensure_future(aw)
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout=delay)
+    except asyncio.TimeoutError:
+        pass
+    
+    try:
+        await show_progress()
+    except Exception as e:
+        logger.warning(f"Не удалось показать статус: {e}")
+    return await task
+
+
+async def _suggest_products(nomenclature: str) -> list[IikoProduct]:
+    """Продукты iiko для номенклатуры поставщика.
+    
+    Точное совпадение названия — сразу единственный вариант; иначе
+    поиск по первым двум словам названия.
+    """
+    exact = await find_product_by_name(nomenclature)
+    if exact is not None:
+        return [exact]
+    return await _cached_search_products(_first_n_words(nomenclature, 2), limit=5)
+
+
+async def _resolved(value: T) -> T:
+    """Готовое значение как awaitable — для необязательных шагов в asyncio.gather."""
+    return value
+
+
+def _first_n_words(text: str, n: int) -> str:
+    """Первые n слов строки; split ограничен n разбиениями, хвост не дробится."""
+    words = text.split(None, n)[:n]
+    return " ".join(words) if words else text[:20]
+
+
+def _parse_price(value: Any) -> float | None:
+    """Привести цену к float; None, если значение не является числом."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).translate(_PRICE_TRANS))
+    except ValueError:
+        return None
+
+
+def _dev_cache(context: ContextTypes.DEFAULT_TYPE) -> dict[str, Any]:
+    """Объёмные данные диалога пользователя (списки заявок, продуктов, клавиатуры).
+    
+    Хранятся в bot_data, которое не сохраняется persistence, — в user_data
+    (сериализуется после каждого апдейта) остаются только выбранные записи.
+    После перезапуска бота списки пусты, и выбор из старой клавиатуры
+    получит «не найдена».
+    """
+    return context.bot_data.setdefault("_dev_cache", {}).setdefault(context.user_id, {})
+
+
+def _drop_from_dev_cache(context: ContextTypes.DEFAULT_TYPE, *keys: str) -> None:
+    """Удалить ключи из _dev_cache; пустую запись пользователя убрать целиком."""
+    caches = context.bot_data.get("_dev_cache", {})
+    cache = caches.get(context.user_id)
+    if cache is None:
+        return
+    for key in keys:
+        cache.pop(key, None)
+    if not cache:
+        del caches[context.user_id]
+
+
+def _memo_in_dev_cache(
+    context: ContextTypes.DEFAULT_TYPE,
+    key: str,
+    fingerprint: Hashable,
+    build: Callable[[], Any],
+) -> Any:
+    """Вернуть ранее построенное значение, если исходные данные не изменились."""
+    cache = _dev_cache(context)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    value = build()
+    cache[key] = (fingerprint, value)
+    return value
+
+
+def _products_markup(
+    context: ContextTypes.DEFAULT_TYPE,
+    products: list[IikoProduct],
+    search_label: str,
+) -> InlineKeyboardMarkup:
+    """Клавиатура выбора продукта iiko (переиспользуется при повторном показе)."""
+    def build() -> InlineKeyboardMarkup:
+        # ID продукта стабилен — кнопка не зависит от порядка в выдаче
+        keyboard = [
+            [InlineKeyboardButton(prod.label, callback_data=f"dev:prod:{prod.id}")]
+            for prod in products
+        ]
+        keyboard.append([InlineKeyboardButton(search_label, callback_data="dev:manual_search")])
+        keyboard.append(_CANCEL_ROW_DEV)
+        return InlineKeyboardMarkup(keyboard)
+    
+    fingerprint = (search_label, tuple(prod.id for prod in products))
+    return _memo_in_dev_cache(context, "_dev_prod_markup", fingerprint, build)
 
 
+@lru_cache(maxsize=1024)
 def _extract_folder_id(folder_link: str) -> str | None:
     """Извлечь folder_id из ссылки Google Drive."""
     if not folder_link:
@@ -1086,17 +1549,35 @@ def _extract_folder_id(folder_link: str) -> str | None:
     # Паттерны ссылок:
     # https://drive.google.com/drive/folders/FOLDER_ID
     # https://drive.google.com/drive/u/0/folders/FOLDER_ID
-    patterns = [
-        r"folders/([a-zA-Z0-9_-]+)",
-        r"id=([a-zA-Z0-9_-]+)",
-    ]
+    return _id_after(folder_link, "folders/", _FOLDER_RE) or _id_after(folder_link, "id=", _ID_RE)
+
+
+def _id_after(link: str, marker: str, pattern: re.Pattern[str]) -> str | None:
+    """ID, идущий сразу за marker в ссылке.
     
-    for pattern in patterns:
-        match = re.search(pattern, folder_link)
-        if match:
-            return match.group(1)
+    Обычные ссылки разбираются цепочкой partition; regex нужен только
+    для нестандартных (ID обрывается на символе вне [a-zA-Z0-9_-]).
+    """
+    candidate = link.partition(marker)[2]
+    for sep in "/?&#":
+        candidate = candidate.partition(sep)[0]
+    if candidate and _ID_CHARS.issuperset(candidate):
+        return candidate
+    match = pattern.search(link)
+    return match.group(1) if match else None
+
+
+def _dev_router(routes: dict[str, Callable[..., Awaitable[Any]]]) -> CallbackQueryHandler:
+    """Один CallbackQueryHandler на состояние: действие из dev:<action>[:...] ищется в словаре."""
+    async def route(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Any:
+        handler = routes.get(context.matches[0].group(1))
+        if handler is None:
+            # Кнопка из другого шага диалога — просто убираем «часики»
+            await update.callback_query.answer()
+            return None
+        return await handler(update, context)
     
-    return None
+    return CallbackQueryHandler(route, pattern=_DEV_CALLBACK_RE)
 
 
 def get_development_handler() -> ConversationHandler:
@@ -1104,38 +1585,44 @@ def get_development_handler() -> ConversationHandler:
     return ConversationHandler(
         entry_points=[
             MessageHandler(
-                filters.Regex("^🔄 Проработки \\(Заявки\\)$"),
+                # Кнопки меню — точное совпадение текста (поиск во множестве, без regex)
+                filters.Text(frozenset({"🔄 Проработки (Заявки)"})),
                 show_development_menu,
             ),
             MessageHandler(
-                filters.Regex("^📋 Заявки в работе$"),
+                filters.Text(frozenset({"📋 Заявки в работе"})),
                 start_my_requests,
             ),
         ],
         states={
             # === Этап 1: Создание акта ===
             DEV_MENU: [
-                CallbackQueryHandler(create_act_start, pattern=r"^dev:create_act$"),
-                CallbackQueryHandler(my_requests_handler, pattern=r"^dev:my_requests$"),
-                CallbackQueryHandler(close_menu, pattern=r"^dev:close$"),
+                _dev_router({
+                    "create_act": create_act_start,
+                    "my_requests": my_requests_handler,
+                    "close": close_menu,
+                }),
             ],
             DEV_SELECT_REQUEST: [
-                CallbackQueryHandler(request_selected, pattern=r"^dev:req:\d+$"),
-                CallbackQueryHandler(cancel_handler, pattern=r"^dev:cancel$"),
+                _dev_router({"req": request_selected, "cancel": cancel_handler}),
             ],
             DEV_SEARCH_PRODUCT: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, search_product),
-                CallbackQueryHandler(cancel_handler, pattern=r"^dev:cancel$"),
+                _dev_router({"cancel": cancel_handler}),
             ],
             DEV_SELECT_PRODUCT: [
-                CallbackQueryHandler(product_selected, pattern=r"^dev:prod:\d+$"),
-                CallbackQueryHandler(manual_search_start, pattern=r"^dev:manual_search$"),
-                CallbackQueryHandler(cancel_handler, pattern=r"^dev:cancel$"),
+                _dev_router({
+                    "prod": product_selected,
+                    "manual_search": manual_search_start,
+                    "cancel": cancel_handler,
+                }),
             ],
             DEV_CONFIRM: [
-                CallbackQueryHandler(confirm_create_act, pattern=r"^dev:confirm_create$"),
-                CallbackQueryHandler(manual_search_start, pattern=r"^dev:manual_search$"),
-                CallbackQueryHandler(cancel_handler, pattern=r"^dev:cancel$"),
+                _dev_router({
+                    "confirm_create": confirm_create_act,
+                    "manual_search": manual_search_start,
+                    "cancel": cancel_handler,
+                }),
             ],
             # === Этап 2: Завершение проработки ===
             COMPLETE_SELECT_REQUEST: [
@@ -1164,6 +1651,10 @@ def get_development_handler() -> ConversationHandler:
                 CallbackQueryHandler(complete_finish, pattern=r"^compl:finish$"),
                 CallbackQueryHandler(complete_cancel, pattern=r"^compl:cancel$"),
             ],
+            # === Таймаут бездействия ===
+            ConversationHandler.TIMEOUT: [
+                TypeHandler(Update, timeout_handler),
+            ],
         },
         fallbacks=[
             CallbackQueryHandler(cancel_handler, pattern=r"^dev:cancel$"),
@@ -1171,6 +1662,7 @@ def get_development_handler() -> ConversationHandler:
             MessageHandler(filters.Regex("^/cancel$"), cancel_handler),
         ],
         name="development_process",
-        persistent=False,
+        persistent=True,
         allow_reentry=True,
+        conversation_timeout=CONVERSATION_TIMEOUT,
     )
@@ -9,14 +9,26 @@ from telegram import Update, ChatMemberUpdated
 from telegram.constants import ChatMemberStatus, ChatType
 from telegram.ext import ContextTypes, ChatMemberHandler
 
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, update as sa_update
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.models.base import async_session_factory
+from bot.models.base import async_session_factory, dialect_insert
 from bot.models.telegram_group import TelegramGroup
 from bot.models.user import User
 from bot.config import SUPERADMIN_IDS
 
 
+# Статусы, при которых бот считается участником группы (LEFT/BANNED — нет)
+_MEMBER_STATUSES = frozenset({
+    ChatMemberStatus.MEMBER,
+    ChatMemberStatus.ADMINISTRATOR,
+    ChatMemberStatus.OWNER,
+    ChatMemberStatus.RESTRICTED,
+})
+
+_GROUP_CHAT_TYPES = frozenset({ChatType.GROUP, ChatType.SUPERGROUP})
+
+
 def _extract_status_change(chat_member_update: ChatMemberUpdated) -> tuple[bool, bool]:
     """
     Извлечь информацию об изменении статуса бота.
@@ -24,34 +36,17 @@ def _extract_status_change(chat_member_update: ChatMemberUpdated) -> tuple[bool,
     Returns:
         (was_member, is_member) — был ли участником, стал ли участником
     """
-    status_changes = {
-        ChatMemberStatus.LEFT: False,
-        ChatMemberStatus.BANNED: False,
-        ChatMemberStatus.MEMBER: True,
-        ChatMemberStatus.ADMINISTRATOR: True,
-        ChatMemberStatus.OWNER: True,
-        ChatMemberStatus.RESTRICTED: True,
-    }
-    
-    old_status = chat_member_update.old_chat_member.status
-    new_status = chat_member_update.new_chat_member.status
-    
-    was_member = status_changes.get(old_status, False)
-    is_member = status_changes.get(new_status, False)
-    
-    return was_member, is_member
+    return (
+        chat_member_update.old_chat_member.status in _MEMBER_STATUSES,
+        chat_member_update.new_chat_member.status in _MEMBER_STATUSES,
+    )
 
 
-async def _get_company_id_from_adder(adder_telegram_id: int) -> Optional[int]:
+async def _get_company_id_from_adder(session: AsyncSession, adder_telegram_id: int) -> Optional[int]:
     """Получить company_id пользователя, который добавил бота."""
-    async with async_session_factory() as session:
-        result = await session.execute(
-            select(User.company_id).where(User.telegram_id == adder_telegram_id)
-        )
-        row = result.first()
-        if row:
-            return row[0]
-    return None
+    return await session.scalar(
+        select(User.company_id).where(User.telegram_id == adder_telegram_id)
+    )
 
 
 async def handle_bot_added_to_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -61,14 +56,18 @@ async def handle_bot_added_to_group(update: Update, context: ContextTypes.DEFAUL
     if not chat_member:
         return
     
+    was_member, is_member = _extract_status_change(chat_member)
+    
+    # Смена роли без входа/выхода (например, MEMBER -> ADMINISTRATOR) — делать нечего
+    if was_member == is_member:
+        return
+    
     chat = chat_member.chat
     
     # Обрабатываем только группы и супергруппы
-    if chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
+    if chat.type not in _GROUP_CHAT_TYPES:
         return
     
-    was_member, is_member = _extract_status_change(chat_member)
-    
     # Бот был добавлен в группу
     if not was_member and is_member:
         adder = chat_member.from_user
@@ -77,8 +76,25 @@ async def handle_bot_added_to_group(update: Update, context: ContextTypes.DEFAUL
             f"добавил: @{adder.username or adder.id}"
         )
         
-        # Определяем company_id от пользователя, который добавил бота
-        company_id = await _get_company_id_from_adder(adder.id)
+        # Компанию добавившего и запись группы обрабатываем в одной сессии
+        async with async_session_factory() as session:
+            # Определяем company_id от пользователя, который добавил бота
+            company_id = await _get_company_id_from_adder(session, adder.id)
+            
+            if company_id:
+                # Одна инструкция INSERT ... ON CONFLICT: новая группа создаётся,
+                # уже известная — обновляется и активируется
+                title = chat.title or "Без названия"
+                await session.execute(
+                    dialect_insert(TelegramGroup)
+                    .values(company_id=company_id, chat_id=chat.id, title=title, is_active=True)
+                    .on_conflict_do_update(
+                        index_elements=[TelegramGroup.chat_id],
+                        set_={"title": title, "is_active": True, "company_id": company_id},
+                    )
+                )
+                await session.commit()
+                logger.info(f"Группа {chat.id} сохранена для компании {company_id}")
         
         if not company_id:
             # Если пользователь не в системе, проверяем суперадминов
@@ -98,33 +114,6 @@ async def handle_bot_added_to_group(update: Update, context: ContextTypes.DEFAUL
                 )
             return
         
-        # Сохраняем группу в БД
-        async with async_session_factory() as session:
-            # Проверяем, не сохранена ли уже эта группа
-            existing = await session.execute(
-                select(TelegramGroup).where(TelegramGroup.chat_id == chat.id)
-            )
-            existing_group = existing.scalar_one_or_none()
-            
-            if existing_group:
-                # Обновляем название и активируем
-                existing_group.title = chat.title or "Без названия"
-                existing_group.is_active = True
-                existing_group.company_id = company_id
-                logger.info(f"Группа {chat.id} обновлена для компании {company_id}")
-            else:
-                # Создаём новую запись
-                new_group = TelegramGroup(
-                    company_id=company_id,
-                    chat_id=chat.id,
-                    title=chat.title or "Без названия",
-                    is_active=True,
-                )
-                session.add(new_group)
-                logger.info(f"Группа {chat.id} сохранена для компании {company_id}")
-            
-            await session.commit()
-        
         await context.bot.send_message(
             chat.id,
             f"✅ Я добавлен в группу и готов отправлять уведомления о срочных заявках.\n\n"
@@ -135,17 +124,17 @@ async def handle_bot_added_to_group(update: Update, context: ContextTypes.DEFAUL
     elif was_member and not is_member:
         logger.info(f"Бот удалён из группы: chat_id={chat.id}, title='{chat.title}'")
         
-        # Деактивируем группу (не удаляем из БД)
+        # Деактивируем группу (не удаляем из БД) — один UPDATE без предварительного SELECT
         async with async_session_factory() as session:
             result = await session.execute(
-                select(TelegramGroup).where(TelegramGroup.chat_id == chat.id)
+                sa_update(TelegramGroup)
+                .where(TelegramGroup.chat_id == chat.id)
+                .values(is_active=False)
             )
-            group = result.scalar_one_or_none()
-            
-            if group:
-                group.is_active = False
-                await session.commit()
-                logger.info(f"Группа {chat.id} деактивирована")
+            await session.commit()
+        
+        if result.rowcount:
+            logger.info(f"Группа {chat.id} деактивирована")
 
 
 def get_group_events_handler() -> ChatMemberHandler:
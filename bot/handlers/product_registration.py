@@ -1,10 +1,12 @@
 """Процесс заведения продукта на проработку."""
+import asyncio
 import tempfile
+from dataclasses import dataclass
 from pathlib import Path
 
 from loguru import logger
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove, Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Message, ReplyKeyboardRemove, Update
 from telegram.ext import (
     CallbackQueryHandler,
     ContextTypes,
@@ -73,18 +75,68 @@ def _get_draft(context: ContextTypes.DEFAULT_TYPE) -> dict:
 
 
 def _save_draft(context: ContextTypes.DEFAULT_TYPE, data: dict) -> None:
-    """Сохранить черновик."""
-    key = _get_draft_key(context)
-    context.user_data[key] = {**_get_draft(context), **data}
-    logger.debug(f"Черновик сохранён: keys={list(context.user_data[key].keys())}")
+    """Сохранить черновик (поля дописываются в существующий словарь)."""
+    draft = context.user_data.setdefault(_get_draft_key(context), {})
+    draft.update(data)
+    # lazy: список ключей собирается, только если DEBUG-уровень включён
+    logger.opt(lazy=True).debug("Черновик сохранён: keys={}", lambda: list(draft))
+
+
+def _write_temp_file(data: bytes, suffix: str) -> Path:
+    """Записать данные во временный файл (delete=False) и вернуть путь."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(data)
+    return Path(tmp.name)
+
+
+async def _download_to_temp(file, suffix: str) -> Path:
+    """Скачать файл Telegram во временный файл.
+    
+    Содержимое скачивается в память, а создание и запись файла идут в потоке —
+    цикл событий не блокируется дисковым вводом-выводом.
+    """
+    data = await file.download_as_bytearray()
+    return await asyncio.to_thread(_write_temp_file, bytes(data), suffix)
 
 
 # Константы пагинации
 SUPPLIERS_PER_PAGE = 10
 
 
+# Колонки реестра A:G (Дата … ФИО), используемые при выборе поставщика
+_SUPPLIER_COLUMNS = 7
+_ROW_PADDING = [""] * _SUPPLIER_COLUMNS
+
+
+@dataclass(slots=True, frozen=True)
+class _SupplierRow:
+    """Поставщик из реестра — только колонки, нужные для выбора."""
+
+    name: str
+    inn: str
+    kpp: str
+    email: str
+    phone: str
+    contact: str
+
+
+def _project_suppliers(rows: list[list]) -> list[_SupplierRow]:
+    """Оставить поставщиков с наименованием и только используемые колонки.
+    
+    Структура строки: Дата, ИНН, КПП, Наименование, Email, Телефон, ФИО, Предмет, Точки, Ответственный
+    """
+    # Один проход выравнивания: короткие строки дополняем пустыми ячейками,
+    # дальше индексация без проверок длины
+    padded = ((row + _ROW_PADDING)[:_SUPPLIER_COLUMNS] for row in rows)
+    return [
+        _SupplierRow(name=name, inn=inn, kpp=kpp, email=email, phone=phone, contact=contact)
+        for _date, inn, kpp, name, email, phone, contact in padded
+        if name  # Колонка D — Наименование
+    ]
+
+
 def _build_suppliers_keyboard(
-    suppliers: list,
+    suppliers: list[_SupplierRow],
     page: int,
     company_name: str,
 ) -> tuple[list, str]:
@@ -111,13 +163,9 @@ def _build_suppliers_keyboard(
     
     keyboard = []
     
-    # Кнопки поставщиков
-    for idx, row in enumerate(page_suppliers):
-        if len(row) > 3 and row[3]:  # Колонка D — Наименование
-            name = row[3][:40]
-            # Глобальный индекс в списке
-            global_idx = start_idx + idx
-            keyboard.append([InlineKeyboardButton(name, callback_data=f"sup_sel:{global_idx}")])
+    # Кнопки поставщиков (индекс — глобальный, в полном списке)
+    for global_idx, supplier in enumerate(page_suppliers, start_idx):
+        keyboard.append([InlineKeyboardButton(supplier.name[:40], callback_data=f"sup_sel:{global_idx}")])
     
     # Кнопки пагинации
     if total_pages > 1:
@@ -150,6 +198,43 @@ def _build_suppliers_keyboard(
     return keyboard, text
 
 
+def _prebuild_pages(
+    suppliers: list[_SupplierRow],
+    company_name: str,
+) -> list[tuple[str, InlineKeyboardMarkup]]:
+    """Построить все страницы списка поставщиков: (текст, клавиатура) на страницу."""
+    total_pages = max(1, (len(suppliers) + SUPPLIERS_PER_PAGE - 1) // SUPPLIERS_PER_PAGE)
+    pages = []
+    for page in range(total_pages):
+        keyboard, text = _build_suppliers_keyboard(suppliers, page, company_name)
+        pages.append((text, InlineKeyboardMarkup(keyboard)))
+    return pages
+
+
+# (sheet_id, компания) -> (строки реестра, из которых построено, поставщики, страницы).
+# Строки сравниваются по идентичности: пока google_sheets_service отдаёт тот же
+# закешированный список, страницы не перестраиваются; после add_supplier список новый.
+_supplier_pages_cache: dict[
+    tuple[str, str], tuple[list, list[_SupplierRow], list[tuple[str, InlineKeyboardMarkup]]]
+] = {}
+
+
+async def _load_supplier_pages(
+    sheet_id: str,
+    company_name: str,
+) -> tuple[list[_SupplierRow], list[tuple[str, InlineKeyboardMarkup]]]:
+    """Поставщики компании и готовые страницы выбора (из кеша, если реестр не менялся)."""
+    rows = await google_sheets_service.get_supplier_rows(sheet_id)
+    key = (sheet_id, company_name)
+    cached = _supplier_pages_cache.get(key)
+    if cached and cached[0] is rows:
+        return cached[1], cached[2]
+    suppliers = _project_suppliers(rows)
+    pages = _prebuild_pages(suppliers, company_name)
+    _supplier_pages_cache[key] = (rows, suppliers, pages)
+    return suppliers, pages
+
+
 async def start_product_registration(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Начало заведения продукта — показ списка поставщиков из Google Sheets."""
     telegram_id = update.effective_user.id
@@ -187,26 +272,22 @@ async def start_product_registration(update: Update, context: ContextTypes.DEFAU
     }
     
     # Очищаем черновик (теперь company_id доступен для формирования ключа)
-    _save_draft(context, {})
+    context.user_data[_get_draft_key(context)] = {}
     
     # Загружаем поставщиков из Google Sheets
-    suppliers = await google_sheets_service.get_all_rows(
-        sheet_id, 
-        worksheet_name="Реестр_Поставщики",
-        skip_header=True,
-    )
-    
-    # Сохраняем ВЕСЬ список для пагинации
-    context.user_data["suppliers_list"] = suppliers
-    context.user_data["suppliers_page"] = 0
+    suppliers, pages = await _load_supplier_pages(sheet_id, company_info.company_name)
     
-    # Формируем клавиатуру с пагинацией
-    keyboard, text = _build_suppliers_keyboard(suppliers, 0, company_info.company_name)
+    # Сохраняем ВЕСЬ список и готовые страницы для пагинации — в chat_data,
+    # он не попадает в persistence
+    context.chat_data["suppliers_list"] = suppliers
+    context.chat_data["suppliers_pages"] = pages
+    context.chat_data["suppliers_page"] = 0
     
+    text, markup = pages[0]
     await update.message.reply_text(
         text,
         parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=markup,
     )
     return SUPPLIER
 
@@ -214,29 +295,32 @@ async def start_product_registration(update: Update, context: ContextTypes.DEFAU
 async def supplier_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка выбора поставщика из списка."""
     query = update.callback_query
-    await query.answer()
     data = query.data
+    
+    if data == "sup_page:noop":
+        # Нажали на номер страницы — ничего не делаем; cache_time просит клиент
+        # не присылать повторные нажатия этой кнопки
+        await query.answer(cache_time=3600)
+        return SUPPLIER
+    
+    await query.answer()
     logger.debug(f"supplier_selected: data={data}")
     
     # Пагинация
     if data.startswith("sup_page:"):
         page_str = data.split(":")[1]
-        if page_str == "noop":
-            # Нажали на номер страницы — ничего не делаем
+        pages = context.chat_data.get("suppliers_pages")
+        if not pages:
             return SUPPLIER
+        page = max(0, min(int(page_str), len(pages) - 1))
         
-        page = int(page_str)
-        suppliers = context.user_data.get("suppliers_list", [])
-        company_info = context.user_data.get("product_company_info", {})
-        company_name = company_info.get("company_name", "")
-        
-        context.user_data["suppliers_page"] = page
-        keyboard, text = _build_suppliers_keyboard(suppliers, page, company_name)
+        context.chat_data["suppliers_page"] = page
+        text, markup = pages[page]
         
         await query.edit_message_text(
             text,
             parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=markup,
         )
         return SUPPLIER
     
@@ -258,18 +342,17 @@ async def supplier_selected(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Выбор существующего поставщика
     if data.startswith("sup_sel:"):
         idx = int(data.split(":")[1])
-        suppliers_list = context.user_data.get("suppliers_list", [])
+        suppliers_list = context.chat_data.get("suppliers_list", [])
         
         if idx < len(suppliers_list):
-            row = suppliers_list[idx]
-            # Структура: Дата, ИНН, КПП, Наименование, Email, Телефон, ФИО, Предмет, Точки, Ответственный
+            supplier = suppliers_list[idx]
             supplier_data = {
-                "supplier_name": row[3] if len(row) > 3 else "",
-                "supplier_inn": row[1] if len(row) > 1 else "",
-                "supplier_kpp": row[2] if len(row) > 2 else "",
-                "supplier_email": row[4] if len(row) > 4 else "",
-                "supplier_phone": row[5] if len(row) > 5 else "",
-                "supplier_contact": row[6] if len(row) > 6 else "",
+                "supplier_name": supplier.name,
+                "supplier_inn": supplier.inn,
+                "supplier_kpp": supplier.kpp,
+                "supplier_email": supplier.email,
+                "supplier_phone": supplier.phone,
+                "supplier_contact": supplier.contact,
             }
             _save_draft(context, supplier_data)
             
@@ -584,45 +667,34 @@ async def supplier_card_uploaded(update: Update, context: ContextTypes.DEFAULT_T
         return SUPPLIER_CARD
     
     # Скачиваем файл
-    import tempfile
-    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(filename).suffix) as tmp:
-        await file.download_to_drive(tmp.name)
-        tmp_path = Path(tmp.name)
+    tmp_path = await _download_to_temp(file, Path(filename).suffix)
     
     logger.debug(f"Карточка скачана: {tmp_path}, size={tmp_path.stat().st_size}")
     
-    # Загружаем в Google Drive (папка "Поставщики" -> "Наименование поставщика")
-    card_file_id = None
-    card_link = None
-    
-    if drive_folder_id:
-        supplier_name = supplier_data.get("name", "Неизвестный")
-        supplier_folder_id = create_supplier_folder(supplier_name, drive_folder_id)
-        
-        if supplier_folder_id:
-            card_file_id = upload_supplier_card(tmp_path, supplier_folder_id, filename, mime_type)
-            if card_file_id:
-                card_link = get_file_link(card_file_id)
-                context.user_data["supplier_card_path"] = tmp_path
-                context.user_data["supplier_card_link"] = card_link
-                logger.info(f"Карточка загружена в Drive: {card_link}")
-            else:
-                logger.error("Ошибка загрузки карточки в Drive")
-        else:
-            logger.error("Ошибка создания папки поставщика")
-    
     await update.message.reply_text(
         "📎 Карточка поставщика получена!\n\n"
         "Отправляю письма на заведение...",
         parse_mode="Markdown",
     )
     
-    # Отправляем 4 письма
-    await _send_registration_emails(update, context, tmp_path if tmp_path.exists() else None)
+    # Загрузка в Drive и 4 письма идут в фоне — диалог сразу переходит дальше,
+    # итог отправки придёт отдельным сообщением. Данные поставщика передаём копией:
+    # пока задача работает, пользователь может выбрать другого поставщика.
+    context.application.create_task(
+        _upload_card_and_send_emails(
+            update.message,
+            dict(supplier_data),
+            tmp_path,
+            filename,
+            mime_type,
+            drive_folder_id,
+        ),
+        update=update,
+    )
     
     # Переходим к выбору единицы измерения
     await update.message.reply_text(
-        f"✅ Поставщик *{supplier_data.get('name', '')}* отправлен на заведение!\n\n"
+        f"✅ Поставщик *{supplier_data.get('name', '')}* отправляется на заведение!\n\n"
         "Теперь продолжим с проработкой продукта.\n"
         "Выберите единицу измерения:",
         parse_mode="Markdown",
@@ -631,14 +703,54 @@ async def supplier_card_uploaded(update: Update, context: ContextTypes.DEFAULT_T
     return UNIT
 
 
+async def _upload_card_and_send_emails(
+    message: Message,
+    supplier_data: dict,
+    tmp_path: Path,
+    filename: str,
+    mime_type: str,
+    drive_folder_id: str | None,
+) -> None:
+    """Фоном: загрузить карточку поставщика в Google Drive и отправить письма на заведение.
+    
+    Об ошибке пользователь узнаёт сообщением в чат — ответ хэндлера уже ушёл.
+    """
+    try:
+        # Папка "Поставщики" -> "Наименование поставщика"; клиент Drive синхронный — в потоке
+        if drive_folder_id:
+            supplier_name = supplier_data.get("name", "Неизвестный")
+            supplier_folder_id = await asyncio.to_thread(create_supplier_folder, supplier_name, drive_folder_id)
+            
+            if supplier_folder_id:
+                card_file_id = await asyncio.to_thread(
+                    upload_supplier_card, tmp_path, supplier_folder_id, filename, mime_type,
+                )
+                if card_file_id:
+                    logger.info(f"Карточка загружена в Drive: {get_file_link(card_file_id)}")
+                else:
+                    logger.error("Ошибка загрузки карточки в Drive")
+            else:
+                logger.error("Ошибка создания папки поставщика")
+        
+        # Отправляем 4 письма
+        await _send_registration_emails(message, supplier_data, tmp_path if tmp_path.exists() else None)
+    except Exception as e:
+        logger.error(f"Ошибка отправки поставщика на заведение: {e}", exc_info=True)
+        try:
+            await message.reply_text(
+                f"❌ Не удалось отправить поставщика «{supplier_data.get('name', '')}» на заведение.\n"
+                "Обратитесь к администратору.",
+            )
+        except Exception as notify_error:
+            logger.warning(f"Не удалось сообщить об ошибке: {notify_error}")
+
+
 async def _send_registration_emails(
-    update: Update,
-    context: ContextTypes.DEFAULT_TYPE,
+    message: Message,
+    supplier_data: dict,
     card_path: Path = None,
 ) -> None:
-    """Отправить 4 письма для заведения поставщика."""
-    supplier_data = context.user_data.get("current_supplier_data", {})
-    
+    """Отправить 4 письма для заведения поставщика и ответить в чат итогом."""
     supplier = SupplierData(
         name=supplier_data.get("name", ""),
         inn=supplier_data.get("inn", ""),
@@ -668,7 +780,7 @@ async def _send_registration_emails(
     
     status_text = "\n".join(status_lines)
     
-    await update.message.reply_text(
+    await message.reply_text(
         f"📧 *Отправка на заведение: {sent_count}/{total}*\n\n"
         f"{status_text}",
         parse_mode="Markdown",
@@ -760,10 +872,9 @@ async def certs_uploaded(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     draft = _get_draft(context)
     certs = draft.get("certs", [])
-    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(fname).suffix) as tmp:
-        await file.download_to_drive(tmp.name)
-        # TODO: загрузить в Google Drive
-        certs.append({"name": fname, "local_path": tmp.name})
+    tmp_path = await _download_to_temp(file, Path(fname).suffix)
+    # TODO: загрузить в Google Drive
+    certs.append({"name": fname, "local_path": str(tmp_path)})
     _save_draft(context, {"certs": certs})
     logger.info(f"Сертификат получен: {fname}, всего: {len(certs)}")
     
@@ -851,9 +962,8 @@ async def photos_product_uploaded(update: Update, context: ContextTypes.DEFAULT_
 
     draft = _get_draft(context)
     photos = draft.get("photos_product", [])
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        await file.download_to_drive(tmp.name)
-        photos.append({"name": fname, "local_path": tmp.name})
+    tmp_path = await _download_to_temp(file, suffix)
+    photos.append({"name": fname, "local_path": str(tmp_path)})
     _save_draft(context, {"photos_product": photos})
     logger.info(f"Фото продукта получено: {fname}, всего: {len(photos)}")
     
@@ -927,9 +1037,8 @@ async def photos_label_uploaded(update: Update, context: ContextTypes.DEFAULT_TY
 
     draft = _get_draft(context)
     photos = draft.get("photos_label", [])
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        await file.download_to_drive(tmp.name)
-        photos.append({"name": fname, "local_path": tmp.name})
+    tmp_path = await _download_to_temp(file, suffix)
+    photos.append({"name": fname, "local_path": str(tmp_path)})
     _save_draft(context, {"photos_label": photos})
     logger.info(f"Фото этикетки получено: {fname}, всего: {len(photos)}")
     
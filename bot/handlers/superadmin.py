@@ -22,6 +22,7 @@ from bot.models import Company, CompanyIntegrations, Position, User, UserRole
 from bot.models.base import async_session_factory
 from bot.models.telegram_group import TelegramGroup
 from bot.models.notification_settings import NotificationPosition
+from bot.services.database import invalidate_positions, invalidate_user_company_info
 from bot.services.google_sheets import google_sheets_service
 
 
@@ -394,6 +395,7 @@ async def toggle_position(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             position.is_active = not position.is_active
             await session.commit()
             company_id = position.company_id
+            invalidate_positions(company_id)
             logger.info(f"Должность {position_id} is_active={position.is_active}")
 
     # Возвращаемся к списку должностей (используем сохранённый company_id)
@@ -449,6 +451,7 @@ async def add_position_name_received(update: Update, context: ContextTypes.DEFAU
         )
         session.add(new_position)
         await session.commit()
+        invalidate_positions(company_id)
 
         logger.info(f"Создана должность: {position_name}, company_id={company_id}")
 
@@ -934,6 +937,9 @@ async def receive_sheet_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
         await session.commit()
 
+    # sheet_id/folder_id компании поменялись — закешированная информация устарела
+    invalidate_user_company_info()
+
     if success:
         text = f"✅ <b>Таблица подключена!</b>\n\n📊 Название: {result}"
     else:
@@ -1007,6 +1013,9 @@ async def receive_folder_id(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
         await session.commit()
 
+    # sheet_id/folder_id компании поменялись — закешированная информация устарела
+    invalidate_user_company_info()
+
     if success:
         text = f"✅ <b>Папка подключена!</b>\n\n📁 Название: {result}"
     else:
@@ -1058,6 +1067,9 @@ async def verify_integrations(update: Update, context: ContextTypes.DEFAULT_TYPE
 
         await session.commit()
 
+    # sheet_id/folder_id компании поменялись — закешированная информация устарела
+    invalidate_user_company_info()
+
     if not results:
         results.append("Нет настроенных интеграций")
 
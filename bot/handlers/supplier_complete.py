@@ -35,13 +35,15 @@ from bot.services.email_service import (
     SC_DOCUMENTS,   # Загрузка документов (договор + протокол)
 ) = range(2)
 
+_FOLDER_ID_RE = re.compile(r"/folders/([a-zA-Z0-9_-]+)")
+
 
 def _extract_folder_id_from_link(link: str) -> Optional[str]:
     """Извлечь ID папки из ссылки Google Drive."""
     if not link:
         return None
     
-    match = re.search(r'/folders/([a-zA-Z0-9_-]+)', link)
+    match = _FOLDER_ID_RE.search(link)
     if match:
         return match.group(1)
     return None
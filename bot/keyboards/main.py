@@ -1,4 +1,9 @@
-"""Главное меню и кнопки."""
+"""Главное меню и кнопки.
+
+Клавиатуры неизменяемы (PTB), поэтому каждая строится один раз и переиспользуется.
+"""
+from functools import lru_cache
+
 from loguru import logger
 
 from telegram import ReplyKeyboardMarkup, KeyboardButton, WebAppInfo, InlineKeyboardMarkup, InlineKeyboardButton
@@ -8,9 +13,10 @@ from bot.config import get_env
 WEBAPP_URL = get_env("WEBAPP_URL", "https://new-way.ergoproxy.ru")
 
 
+@lru_cache(maxsize=None)
 def get_main_menu_keyboard(is_superadmin: bool = False) -> ReplyKeyboardMarkup:
     """Главное меню для пользователей, состоящих в компании."""
-    logger.debug(f"get_main_menu_keyboard called, is_superadmin={is_superadmin}")
+    logger.debug(f"get_main_menu_keyboard built, is_superadmin={is_superadmin}")
     keyboard = [
         [KeyboardButton("🚀 WorkFlow", web_app=WebAppInfo(url=WEBAPP_URL))],
         [KeyboardButton("📦 Заведение продукта на проработку")],
@@ -23,6 +29,7 @@ def get_main_menu_keyboard(is_superadmin: bool = False) -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
+@lru_cache(maxsize=None)
 def get_webapp_inline_keyboard() -> InlineKeyboardMarkup:
     """Inline-кнопка для открытия Mini App."""
     return InlineKeyboardMarkup([
@@ -33,9 +40,10 @@ def get_webapp_inline_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
+@lru_cache(maxsize=None)
 def get_registration_keyboard(is_superadmin: bool = False) -> ReplyKeyboardMarkup:
     """Клавиатура для новых пользователей без компании."""
-    logger.debug(f"get_registration_keyboard called, is_superadmin={is_superadmin}")
+    logger.debug(f"get_registration_keyboard built, is_superadmin={is_superadmin}")
     keyboard = [
         [KeyboardButton("🔐 Присоединиться к компании")],
     ]
@@ -3,7 +3,7 @@ import sys
 
 from loguru import logger
 
-from bot.config import BOT_TOKEN, get_env
+from bot.config import BOT_TOKEN, data_dir, get_env
 from bot.handlers.admin import get_admin_handlers
 from bot.handlers.development import get_development_handler
 from bot.handlers.group_events import get_group_events_handler
@@ -136,11 +136,32 @@ def main() -> None:
         logger.error("BOT_TOKEN не задан. Укажите в .env")
         sys.exit(1)
 
-    from telegram.ext import Application, CommandHandler, MessageHandler, filters
+    from telegram.ext import (
+        Application,
+        CommandHandler,
+        MessageHandler,
+        PersistenceInput,
+        PicklePersistence,
+        filters,
+    )
+
+    # Состояния persistent-диалогов и user_data переживают перезапуск бота;
+    # chat_data/bot_data не сохраняются (там только временные данные диалогов)
+    persistence = PicklePersistence(
+        filepath=data_dir() / "bot_state.pickle",
+        store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+        update_interval=60,
+    )
 
     application = (
         Application.builder()
         .token(BOT_TOKEN)
+        .persistence(persistence)
+        # Пул соединений к Bot API (keep-alive) — 256 по умолчанию; фоновые задачи
+        # (письма, акты, загрузки) шлют сообщения параллельно с хэндлерами, поэтому
+        # ждём свободное соединение дольше стандартной секунды вместо ошибки пула
+        .pool_timeout(10.0)
+        .connect_timeout(5.0)
         .post_init(post_init)
         .build()
     )
@@ -1,10 +1,15 @@
 """Базовая конфигурация БД."""
+from functools import lru_cache
+from typing import Any
+
 from loguru import logger
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.sql.dml import Insert
 from sqlalchemy.orm import DeclarativeBase
 
-from bot.config import DATABASE_URL
+from bot.config import get_database_url
 
 
 class Base(DeclarativeBase):
@@ -13,17 +18,59 @@ class Base(DeclarativeBase):
     pass
 
 
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=False,
-)
+@lru_cache(maxsize=1)
+def _is_sqlite() -> bool:
+    """Используется ли SQLite."""
+    return get_database_url().startswith("sqlite")
+
+
+@lru_cache(maxsize=1)
+def get_engine() -> AsyncEngine:
+    """Движок БД — создаётся при первом обращении, а не при импорте модуля."""
+    is_sqlite = _is_sqlite()
+    engine = create_async_engine(
+        get_database_url(),
+        echo=False,
+        connect_args={"check_same_thread": False} if is_sqlite else {},
+    )
+
+    if is_sqlite:
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+            """WAL: писатели не блокируют читателей; NORMAL — достаточно для бота."""
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA cache_size=-64000")
+            cursor.close()
+
+    return engine
+
+
+@lru_cache(maxsize=1)
+def _session_maker() -> async_sessionmaker[AsyncSession]:
+    """Фабрика сессий, привязанная к движку."""
+    return async_sessionmaker(
+        get_engine(),
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autoflush=False,
+    )
+
+
+def async_session_factory() -> AsyncSession:
+    """Новая сессия БД (использование: async with async_session_factory() as session)."""
+    return _session_maker()()
+
 
-async_session_factory = async_sessionmaker(
-    engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autoflush=False,
-)
+def dialect_insert(table: Any) -> Insert:
+    """INSERT с поддержкой ON CONFLICT (upsert) для используемого диалекта."""
+    if _is_sqlite():
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(table)
 
 
 async def get_async_session() -> AsyncSession:
@@ -36,7 +83,7 @@ async def init_db() -> None:
     """Инициализация БД (создание таблиц)."""
     import bot.models  # noqa: F401 — регистрируем все модели
 
-    logger.info("Инициализация базы данных", database_url=DATABASE_URL[:50] + "...")
-    async with engine.begin() as conn:
+    logger.info("Инициализация базы данных", database_url=get_database_url()[:50] + "...")
+    async with get_engine().begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     logger.debug("Таблицы созданы успешно")
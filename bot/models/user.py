@@ -28,6 +28,8 @@ class User(Base):
     """Пользователь бота (привязан к компании)."""
 
     __tablename__ = "users"
+    # Индекс уникального ограничения начинается с telegram_id — он же обслуживает
+    # поиск пользователя по telegram_id, отдельный индекс не нужен
     __table_args__ = (UniqueConstraint("telegram_id", "company_id", name="uq_user_telegram_company"),)
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
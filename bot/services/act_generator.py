@@ -1,6 +1,7 @@
 """Генератор акта проработки через копирование Google Sheets шаблона."""
 from __future__ import annotations
 
+import re
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional
@@ -13,6 +14,12 @@ from bot.services.google_drive import copy_file_to_folder, get_spreadsheet_link
 # ID шаблона акта в Google Sheets
 ACT_TEMPLATE_ID = "11bpOd7_vNNVkS7U63CDdz7VqewmAdxBVkimWJTpW7Rk"
 
+# Шаблоны ID файла в ссылках Google Drive (компилируются один раз при импорте)
+_FILE_ID_PATTERNS = (
+    re.compile(r"/d/([a-zA-Z0-9_-]+)"),  # /d/FILE_ID/
+    re.compile(r"id=([a-zA-Z0-9_-]+)"),  # id=FILE_ID
+)
+
 
 @dataclass
 class ActData:
@@ -39,7 +46,7 @@ class ActData:
 
 def _get_sheets_service():
     """Получить клиент Google Sheets."""
-    from bot.config import BASE_DIR, GOOGLE_DRIVE_CREDENTIALS_FILE
+    from bot.config import GOOGLE_DRIVE_CREDENTIALS_FILE, base_dir
     
     if not GOOGLE_DRIVE_CREDENTIALS_FILE:
         logger.warning("GOOGLE_DRIVE_CREDENTIALS_FILE не задан")
@@ -49,7 +56,7 @@ def _get_sheets_service():
         from google.oauth2 import service_account
         from googleapiclient.discovery import build
         
-        creds_path = BASE_DIR / GOOGLE_DRIVE_CREDENTIALS_FILE
+        creds_path = base_dir() / GOOGLE_DRIVE_CREDENTIALS_FILE
         if not creds_path.exists():
             logger.error(f"Файл учётных данных не найден: {creds_path}")
             return None
@@ -385,15 +392,8 @@ def add_photos_to_act(spreadsheet_id: str, photo_links: list[tuple[str, str]]) -
 
 def _extract_file_id_from_link(link: str) -> str | None:
     """Извлечь ID файла из ссылки Google Drive."""
-    import re
-    
-    patterns = [
-        r"/d/([a-zA-Z0-9_-]+)",  # /d/FILE_ID/
-        r"id=([a-zA-Z0-9_-]+)",  # id=FILE_ID
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, link)
+    for pattern in _FILE_ID_PATTERNS:
+        match = pattern.search(link)
         if match:
             return match.group(1)
     
@@ -410,7 +410,7 @@ def export_act_to_pdf(spreadsheet_id: str) -> bytes | None:
     Returns:
         PDF как bytes или None
     """
-    from bot.config import BASE_DIR, GOOGLE_DRIVE_CREDENTIALS_FILE
+    from bot.config import GOOGLE_DRIVE_CREDENTIALS_FILE, base_dir
     
     logger.debug(f"export_act_to_pdf: spreadsheet_id={spreadsheet_id}")
     
@@ -424,7 +424,7 @@ def export_act_to_pdf(spreadsheet_id: str) -> bytes | None:
         from googleapiclient.http import MediaIoBaseDownload
         import io
         
-        creds_path = BASE_DIR / GOOGLE_DRIVE_CREDENTIALS_FILE
+        creds_path = base_dir() / GOOGLE_DRIVE_CREDENTIALS_FILE
         credentials = service_account.Credentials.from_service_account_file(
             str(creds_path),
             scopes=["https://www.googleapis.com/auth/drive"],
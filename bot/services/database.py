@@ -1,6 +1,7 @@
 """Работа с БД."""
 from __future__ import annotations
 
+import time
 from dataclasses import dataclass
 from typing import Optional
 
@@ -9,10 +10,25 @@ from loguru import logger
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 
-from bot.models import Company, Supplier, User
+from bot.models import Company, Position, Supplier, User
 from bot.models.base import async_session_factory
 from bot.models.integrations import CompanyIntegrations
 
+# Кеш названий компаний: company_id -> (момент загрузки, название)
+COMPANY_NAME_TTL = 60.0  # секунд
+_company_name_cache: dict[int, tuple[float, str]] = {}
+
+# Кеш активных должностей: company_id -> (момент загрузки, [(id, name), ...]).
+# Сбрасывается через invalidate_positions() при изменениях из бота;
+# TTL страхует от правок вне процесса (scripts/manage_positions.py).
+POSITIONS_TTL = 300.0  # секунд
+_positions_cache: dict[int, tuple[float, list[tuple[int, str]]]] = {}
+
+# Кеш информации о компании пользователя: telegram_id -> (момент загрузки, UserCompanyInfo).
+# «Не найден» не кешируется — только что одобренный пользователь виден сразу.
+USER_COMPANY_TTL = 60.0  # секунд
+_user_company_cache: dict[int, tuple[float, UserCompanyInfo]] = {}
+
 
 async def get_or_create_default_company() -> Company:
     """Получить или создать компанию по умолчанию (для демо)."""
@@ -31,6 +47,45 @@ async def get_or_create_default_company() -> Company:
         return company
 
 
+async def get_company_name(company_id: int) -> str:
+    """Получить название компании (с TTL-кешем в памяти)."""
+    now = time.monotonic()
+    cached = _company_name_cache.get(company_id)
+    if cached and now - cached[0] < COMPANY_NAME_TTL:
+        return cached[1]
+
+    async with async_session_factory() as session:
+        result = await session.execute(select(Company.name).where(Company.id == company_id))
+        name = result.scalar_one_or_none() or "Компания"
+
+    _company_name_cache[company_id] = (now, name)
+    return name
+
+
+async def get_active_positions(company_id: int) -> list[tuple[int, str]]:
+    """Получить активные должности компании (id, name) в порядке сортировки (с кешем)."""
+    now = time.monotonic()
+    cached = _positions_cache.get(company_id)
+    if cached and now - cached[0] < POSITIONS_TTL:
+        return cached[1]
+
+    async with async_session_factory() as session:
+        result = await session.execute(
+            select(Position.id, Position.name)
+            .where(Position.company_id == company_id, Position.is_active == True)
+            .order_by(Position.sort_order)
+        )
+        positions = [(row[0], row[1]) for row in result.all()]
+
+    _positions_cache[company_id] = (now, positions)
+    return positions
+
+
+def invalidate_positions(company_id: int) -> None:
+    """Сбросить кеш должностей компании (после добавления/изменения)."""
+    _positions_cache.pop(company_id, None)
+
+
 async def get_suppliers_for_company(company_id: int) -> list[tuple[int, str]]:
     """Получить список поставщиков компании (id, name)."""
     logger.debug(f"get_suppliers_for_company called with: company_id={company_id}")
@@ -121,6 +176,27 @@ async def get_user_company_info(telegram_id: int) -> Optional[UserCompanyInfo]:
         return info
 
 
+async def get_user_company_info_cached(telegram_id: int) -> Optional[UserCompanyInfo]:
+    """get_user_company_info с TTL-кешем в памяти процесса."""
+    now = time.monotonic()
+    cached = _user_company_cache.get(telegram_id)
+    if cached and now - cached[0] < USER_COMPANY_TTL:
+        return cached[1]
+
+    info = await get_user_company_info(telegram_id)
+    if info:
+        _user_company_cache[telegram_id] = (now, info)
+    return info
+
+
+def invalidate_user_company_info(telegram_id: Optional[int] = None) -> None:
+    """Сбросить кеш информации о компании (одного пользователя или весь)."""
+    if telegram_id is None:
+        _user_company_cache.clear()
+    else:
+        _user_company_cache.pop(telegram_id, None)
+
+
 async def get_company_integrations(company_id: int) -> Optional[CompanyIntegrations]:
     """Получить настройки интеграций компании."""
     logger.debug(f"get_company_integrations called with: company_id={company_id}")
@@ -12,7 +12,7 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 from pathlib import Path
-from typing import Optional, List
+from typing import Any, Optional, List
 from dataclasses import dataclass, field
 
 from loguru import logger
@@ -190,12 +190,14 @@ def _create_mime_message(
             # Поддержка трёх форматов:
             # 1. Path — имя файла из path.name
             # 2. (name, Path) — указанное имя + файл
-            # 3. dict(filename, content, content_type) — bytes напрямую
+            # 3. dict(filename, content | stream, content_type) — bytes или файловый объект
             
             if isinstance(item, dict):
                 # Формат: {"filename": "...", "content": bytes, "content_type": "..."}
+                # или {"filename": "...", "stream": BytesIO, "content_type": "..."}
                 display_name = item.get("filename", "attachment")
-                content = item.get("content", b"")
+                stream = item.get("stream")
+                content = stream.read() if stream is not None else item.get("content", b"")
                 content_type = item.get("content_type", "application/octet-stream")
                 
                 maintype, subtype = content_type.split("/", 1) if "/" in content_type else ("application", "octet-stream")
@@ -310,23 +312,26 @@ async def send_email(email: EmailMessage, sender: str = None) -> bool:
             f"(оригинал: to={original_to}, cc={original_cc})"
         )
     
-    # Создаём MIME сообщение
-    message = _create_mime_message(
-        sender=sender,
-        to=email.to,
-        cc=email.cc,
-        subject=email.subject,
-        body=email.body,
-        attachments=email.attachments,
-        message_id=email.message_id,
-    )
-    
     # Собираем всех получателей (to + cc)
     all_recipients = email.to + email.cc
     
+    def _build_and_send() -> bool:
+        # MIME собирается в том же потоке, что и отправка: чтение вложений
+        # и base64-кодирование не занимают цикл событий
+        message = _create_mime_message(
+            sender=sender,
+            to=email.to,
+            cc=email.cc,
+            subject=email.subject,
+            body=email.body,
+            attachments=email.attachments,
+            message_id=email.message_id,
+        )
+        return _send_via_smtp(message, all_recipients)
+    
     try:
         # Отправляем в отдельном потоке (SMTP синхронный)
-        success = await asyncio.to_thread(_send_via_smtp, message, all_recipients)
+        success = await asyncio.to_thread(_build_and_send)
         
         if success:
             logger.info(f"Email отправлен успешно: to={email.to}")
@@ -342,6 +347,15 @@ async def send_email(email: EmailMessage, sender: str = None) -> bool:
         return False
 
 
+def _attachment_label(item: Any) -> str:
+    """Подпись вложения для лога — без содержимого файла."""
+    if isinstance(item, dict):
+        return item.get("filename", "attachment")
+    if isinstance(item, tuple):
+        return item[0]
+    return str(item)
+
+
 def _log_email(email: EmailMessage) -> None:
     """Логировать email если отправка не удалась."""
     logger.info(
@@ -349,7 +363,7 @@ def _log_email(email: EmailMessage) -> None:
         f"To: {', '.join(email.to)}\n"
         f"Cc: {', '.join(email.cc)}\n"
         f"Subject: {email.subject}\n"
-        f"Attachments: {[str(a) for a in email.attachments]}\n"
+        f"Attachments: {[_attachment_label(a) for a in email.attachments]}\n"
         f"---\n{email.body}\n"
         f"=== END EMAIL ==="
     )
@@ -741,20 +755,8 @@ async def send_supplier_registration_emails(
         
         return success
     
-    try:
-        # Письмо 1: Проверка СБ
-        email_1 = create_email_1_sb_check(supplier, card_path, tracking_code)
-        results["email_1_sb"] = await send_and_save(email_1, "sb_check")
-        
-        # Письмо 2: DocsInBox
-        email_2 = create_email_2_docsinbox(supplier, tracking_code)
-        results["email_2_docsinbox"] = await send_and_save(email_2, "docsinbox")
-        
-        # Письмо 3: Роуминг
-        email_3 = create_email_3_roaming(supplier, tracking_code)
-        results["email_3_roaming"] = await send_and_save(email_3, "roaming")
-        
-        # Письмо 4: Документы для поставщика
+    async def send_documents() -> bool:
+        """Письмо 4: скачать документы из Drive и отправить поставщику."""
         if supplier.contact_email:
             # Скачиваем все файлы из папки с документами (без подпапок)
             from bot.services.google_drive import list_files_in_folder, download_file_from_drive
@@ -790,16 +792,36 @@ async def send_supplier_registration_emails(
                     total_size = sum(f[1].stat().st_size for f in downloaded_files) / 1024 / 1024
                     logger.info(f"Всего скачано {len(downloaded_files)} файлов, общий размер: {total_size:.2f} MB")
                     email_4 = create_email_4_documents(supplier, downloaded_files, tracking_code)
-                    results["email_4_documents"] = await send_and_save(email_4, "documents")
+                    return await send_and_save(email_4, "documents")
                 else:
                     logger.error("Не удалось скачать ни одного документа")
-                    results["email_4_documents"] = False
+                    return False
             else:
                 logger.error(f"Файлы не найдены в папке {DOCUMENTS_FOLDER_ID}")
-                results["email_4_documents"] = False
+                return False
         else:
             logger.warning("Email поставщика не указан, письмо 4 не отправлено")
-            results["email_4_documents"] = False
+            return False
+    
+    # Письма независимы — отправляются параллельно; общее время ≈ самое долгое письмо
+    email_types = ("email_1_sb", "email_2_docsinbox", "email_3_roaming", "email_4_documents")
+    try:
+        sent = await asyncio.gather(
+            # Письмо 1: Проверка СБ
+            send_and_save(create_email_1_sb_check(supplier, card_path, tracking_code), "sb_check"),
+            # Письмо 2: DocsInBox
+            send_and_save(create_email_2_docsinbox(supplier, tracking_code), "docsinbox"),
+            # Письмо 3: Роуминг
+            send_and_save(create_email_3_roaming(supplier, tracking_code), "roaming"),
+            # Письмо 4: Документы для поставщика
+            send_documents(),
+            return_exceptions=True,
+        )
+        for email_type, result in zip(email_types, sent):
+            if isinstance(result, BaseException):
+                logger.error(f"Ошибка отправки {email_type}: {result}")
+                result = False
+            results[email_type] = result
         
         sent_count = sum(1 for v in results.values() if v)
         logger.info(f"Отправлено {sent_count}/4 писем для поставщика {supplier.name}")
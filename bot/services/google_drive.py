@@ -7,7 +7,7 @@ from typing import Optional, Union
 
 from loguru import logger
 
-from bot.config import BASE_DIR, GOOGLE_DRIVE_CREDENTIALS_FILE, GOOGLE_DRIVE_FOLDER_ID
+from bot.config import GOOGLE_DRIVE_CREDENTIALS_FILE, GOOGLE_DRIVE_FOLDER_ID, base_dir
 
 
 def _get_drive_service():
@@ -20,7 +20,7 @@ def _get_drive_service():
         from googleapiclient.discovery import build
         from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
 
-        creds_path = BASE_DIR / GOOGLE_DRIVE_CREDENTIALS_FILE
+        creds_path = base_dir() / GOOGLE_DRIVE_CREDENTIALS_FILE
         if not creds_path.exists():
             logger.error(f"Файл учётных данных не найден: {creds_path}")
             return None
@@ -115,35 +115,70 @@ def upload_file_to_drive(
             media = MediaFileUpload(str(file_path), mimetype=mime_type, resumable=True)
         else:
             media = MediaIoBaseUpload(file_path, mimetype=mime_type, resumable=True)
-        file_metadata = {"name": filename, "parents": [folder_id]}
-        file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields="id",
-            supportsAllDrives=True,
-        ).execute()
-        
-        file_id = file["id"]
-        logger.debug(f"Файл загружен: id={file_id}")
-        
-        # Делаем файл публичным для IMAGE() в Sheets
-        if make_public:
-            try:
-                service.permissions().create(
-                    fileId=file_id,
-                    body={"type": "anyone", "role": "reader"},
-                    supportsAllDrives=True,
-                ).execute()
-                logger.debug(f"Файл сделан публичным: {file_id}")
-            except Exception as e:
-                logger.warning(f"Не удалось сделать файл публичным: {e}")
-        
-        return file_id
+        return _create_file(service, media, folder_id, filename, make_public)
+    except Exception as e:
+        logger.error(f"Ошибка загрузки файла: {e}", exc_info=True)
+        return None
+
+
+def upload_bytes_to_drive(
+    data: Union[bytes, bytearray],
+    folder_id: str,
+    filename: str,
+    mime_type: str = "application/octet-stream",
+    make_public: bool = False,
+) -> Optional[str]:
+    """
+    Загрузить небольшой файл из памяти одним запросом (без resumable-сессии).
+    
+    Подходит для фото из Telegram: не нужен ни временный файл, ни лишний
+    запрос на открытие resumable-загрузки.
+    
+    Returns:
+        ID файла или None
+    """
+    from googleapiclient.http import MediaInMemoryUpload
+    
+    logger.info(f"upload_bytes_to_drive called: folder_id={folder_id}, filename={filename}, size={len(data)}")
+    service = _get_drive_service()
+    if not service:
+        return None
+    try:
+        media = MediaInMemoryUpload(bytes(data), mimetype=mime_type, resumable=False)
+        return _create_file(service, media, folder_id, filename, make_public)
     except Exception as e:
         logger.error(f"Ошибка загрузки файла: {e}", exc_info=True)
         return None
 
 
+def _create_file(service, media, folder_id: str, filename: str, make_public: bool) -> str:
+    """Создать файл в папке и при необходимости открыть доступ по ссылке."""
+    file_metadata = {"name": filename, "parents": [folder_id]}
+    file = service.files().create(
+        body=file_metadata,
+        media_body=media,
+        fields="id",
+        supportsAllDrives=True,
+    ).execute()
+    
+    file_id = file["id"]
+    logger.debug(f"Файл загружен: id={file_id}")
+    
+    # Делаем файл публичным для IMAGE() в Sheets
+    if make_public:
+        try:
+            service.permissions().create(
+                fileId=file_id,
+                body={"type": "anyone", "role": "reader"},
+                supportsAllDrives=True,
+            ).execute()
+            logger.debug(f"Файл сделан публичным: {file_id}")
+        except Exception as e:
+            logger.warning(f"Не удалось сделать файл публичным: {e}")
+    
+    return file_id
+
+
 def create_subfolder(parent_folder_id: str, name: str) -> Optional[str]:
     """Создать подпапку (сертификаты, фото продукта, фото этикетки)."""
     logger.debug(f"create_subfolder: parent_id={parent_folder_id}, name={name}")
@@ -1,13 +1,116 @@
 """Сервис для работы с Google Sheets."""
 from __future__ import annotations
 
+import asyncio
 import json
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Optional
 
 from loguru import logger
 
-from bot.config import GOOGLE_DRIVE_CREDENTIALS_FILE, BASE_DIR
+from bot.config import GOOGLE_DRIVE_CREDENTIALS_FILE, base_dir
+
+
+@dataclass(slots=True, frozen=True)
+class DevRequest:
+    """Заявка на проработку из реестра (строка со статусом "Новая")."""
+    row_number: int
+    date: str
+    request_id: str
+    request_type: str
+    sla_days: str
+    deadline: str
+    supplier_name: str
+    supplier_inn: str
+    nomenclature: str
+    unit: str
+    price: float
+    folder_link: str
+    certificate_link: str
+    ocr_link: str
+    status: str
+    # Подпись кнопки в списке заявок — считается один раз при создании записи
+    label: str = field(init=False, compare=False, repr=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(
+            self,
+            "label",
+            f"{self.request_id} | {self.supplier_name[:15]} | {self.nomenclature[:20]}",
+        )
+
+
+def _a1_range(worksheet_name: str, columns: str) -> str:
+    """Диапазон в нотации A1 для листа, например 'Реестр_Проработки'!A:U."""
+    escaped = worksheet_name.replace("'", "''")
+    return f"'{escaped}'!{columns}"
+
+
+def _batch_get_values(gc: Any, sheet_id: str, ranges: list[str]) -> list[list[list[str]]]:
+    """Прочитать несколько диапазонов одним запросом values.batchGet (синхронно).
+    
+    В отличие от open_by_key + worksheet + get_all_values (три запроса к API),
+    не загружает метаданные таблицы. Пустые хвостовые ячейки строк API не возвращает.
+    """
+    response = gc.http_client.values_batch_get(sheet_id, ranges)
+    return [value_range.get("values", []) for value_range in response.get("valueRanges", [])]
+
+
+def _batch_update_values(gc: Any, sheet_id: str, data: dict[str, list[list[Any]]]) -> None:
+    """Записать несколько диапазонов одним запросом values.batchUpdate (синхронно).
+    
+    Значения интерпретируются как при вводе пользователем (USER_ENTERED), как в update_acell.
+    """
+    gc.http_client.values_batch_update(sheet_id, body={
+        "valueInputOption": "USER_ENTERED",
+        "data": [{"range": range_, "values": values} for range_, values in data.items()],
+    })
+
+
+def _append_values(gc: Any, sheet_id: str, range_: str, rows: list[list[Any]]) -> None:
+    """Дописать строки после таблицы в диапазоне одним запросом values.append (синхронно).
+    
+    Позицию новой строки определяет API, поэтому номер последней строки
+    заранее читать не нужно и одновременные добавления не затирают друг друга.
+    """
+    gc.http_client.values_append(
+        sheet_id,
+        range_,
+        params={"valueInputOption": "USER_ENTERED", "insertDataOption": "INSERT_ROWS"},
+        body={"values": rows},
+    )
+
+
+SUPPLIER_EMAILS_TTL = 600.0  # секунд
+SUPPLIER_EMAILS_MISS_TTL = 60.0  # для ИНН, которого не было в реестре при загрузке
+# (sheet_id, лист) -> (момент загрузки, ИНН -> email)
+_supplier_emails_cache: dict[tuple[str, str], tuple[float, dict[str, str]]] = {}
+
+
+def invalidate_supplier_emails(sheet_id: Optional[str] = None) -> None:
+    """Сбросить кеш email поставщиков (одной таблицы или весь)."""
+    if sheet_id is None:
+        _supplier_emails_cache.clear()
+        return
+    for key in [key for key in _supplier_emails_cache if key[0] == sheet_id]:
+        del _supplier_emails_cache[key]
+
+
+SUPPLIER_ROWS_TTL = 60.0  # секунд
+# (sheet_id, лист) -> (момент загрузки, строки без заголовка)
+_supplier_rows_cache: dict[tuple[str, str], tuple[float, list[list[Any]]]] = {}
+_supplier_rows_locks: dict[tuple[str, str], asyncio.Lock] = {}
+
+
+def invalidate_supplier_rows(sheet_id: Optional[str] = None) -> None:
+    """Сбросить кеш строк реестра поставщиков (одной таблицы или весь)."""
+    if sheet_id is None:
+        _supplier_rows_cache.clear()
+        return
+    for key in [key for key in _supplier_rows_cache if key[0] == sheet_id]:
+        del _supplier_rows_cache[key]
 
 
 class GoogleSheetsService:
@@ -35,7 +138,7 @@ class GoogleSheetsService:
 
         if not credentials_path or not credentials_path.exists():
             # Пробуем найти в корне проекта
-            credentials_path = BASE_DIR / "credentials.json"
+            credentials_path = base_dir() / "credentials.json"
 
         if not credentials_path.exists():
             logger.warning(f"Файл credentials.json не найден: {credentials_path}")
@@ -173,7 +276,7 @@ class GoogleSheetsService:
         credentials_path = Path(GOOGLE_DRIVE_CREDENTIALS_FILE) if GOOGLE_DRIVE_CREDENTIALS_FILE else None
 
         if not credentials_path or not credentials_path.exists():
-            credentials_path = BASE_DIR / "credentials.json"
+            credentials_path = base_dir() / "credentials.json"
 
         if not credentials_path.exists():
             return None
@@ -226,6 +329,44 @@ class GoogleSheetsService:
             logger.error(f"Ошибка чтения листа {worksheet_name}: {e}", exc_info=True)
             return []
 
+    async def get_supplier_rows(
+        self,
+        sheet_id: str,
+        worksheet_name: str = "Реестр_Поставщики",
+    ) -> list[list[Any]]:
+        """
+        Строки реестра поставщиков (без заголовка, колонки A:S) с кешем на SUPPLIER_ROWS_TTL.
+        
+        Одновременные запросы одного листа ждут одно чтение. Пустой результат
+        (в т.ч. ошибка чтения) не кешируется. Возвращаемый список общий — не изменять.
+        """
+        key = (sheet_id, worksheet_name)
+        cached = _supplier_rows_cache.get(key)
+        if cached and time.monotonic() - cached[0] < SUPPLIER_ROWS_TTL:
+            return cached[1]
+
+        lock = _supplier_rows_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            cached = _supplier_rows_cache.get(key)
+            if cached and time.monotonic() - cached[0] < SUPPLIER_ROWS_TTL:
+                return cached[1]
+            gc = await self._get_client()
+            if not gc:
+                logger.error("Google API не настроен")
+                return []
+            try:
+                # Один запрос values.batchGet вместо open_by_key + worksheet + get_all_values
+                (rows,) = await asyncio.to_thread(
+                    _batch_get_values, gc, sheet_id, [_a1_range(worksheet_name, "A2:S")],
+                )
+            except Exception as e:
+                logger.error(f"Ошибка чтения листа {worksheet_name}: {e}", exc_info=True)
+                return []
+            logger.debug(f"Получено строк из {worksheet_name}: {len(rows)}")
+            if rows:
+                _supplier_rows_cache[key] = (time.monotonic(), rows)
+            return rows
+
     async def search_suppliers(
         self,
         sheet_id: str,
@@ -352,7 +493,21 @@ class GoogleSheetsService:
             supplier_data.get("tracking_code", ""),        # S: Код заявки
         ]
         
-        return await self.append_row(sheet_id, worksheet_name, row)
+        gc = await self._get_client()
+        if not gc:
+            logger.error("Google API не настроен")
+            return False
+        
+        try:
+            await asyncio.to_thread(_append_values, gc, sheet_id, _a1_range(worksheet_name, "A:S"), [row])
+            logger.info(f"Строка добавлена в таблицу {sheet_id}")
+            added = True
+        except Exception as e:
+            logger.error(f"Ошибка добавления строки: {e}", exc_info=True)
+            added = False
+        invalidate_supplier_emails(sheet_id)
+        invalidate_supplier_rows(sheet_id)
+        return added
     
     async def update_supplier_reply_status(
         self,
@@ -594,7 +749,7 @@ class GoogleSheetsService:
         self,
         sheet_id: str,
         worksheet_name: str = "Реестр_Проработки",
-    ) -> list[dict[str, Any]]:
+    ) -> list[DevRequest]:
         """
         Получить заявки на проработку со статусом "Новая".
         
@@ -616,11 +771,8 @@ class GoogleSheetsService:
         
         try:
             def _get_new():
-                spreadsheet = gc.open_by_key(sheet_id)
-                worksheet = spreadsheet.worksheet(worksheet_name)
-                
-                # Получаем все строки
-                all_rows = worksheet.get_all_values()
+                # Одним запросом читаем только нужные колонки (до Q)
+                (all_rows,) = _batch_get_values(gc, sheet_id, [_a1_range(worksheet_name, "A:Q")])
                 if len(all_rows) < 2:
                     return []
                 
@@ -643,23 +795,23 @@ class GoogleSheetsService:
                         except ValueError:
                             price = 0.0
                         
-                        request_data = {
-                            "row_number": row_idx,
-                            "date": row[0] if len(row) > 0 else "",
-                            "request_id": row[1] if len(row) > 1 else "",
-                            "request_type": row[2] if len(row) > 2 else "",
-                            "sla_days": row[3] if len(row) > 3 else "",
-                            "deadline": row[4] if len(row) > 4 else "",
-                            "supplier_name": row[5] if len(row) > 5 else "",
-                            "supplier_inn": row[6] if len(row) > 6 else "",
-                            "nomenclature": row[7] if len(row) > 7 else "",
-                            "unit": row[8] if len(row) > 8 else "",
-                            "price": price,
-                            "folder_link": row[10] if len(row) > 10 else "",
-                            "certificate_link": row[11] if len(row) > 11 else "",  # L
-                            "ocr_link": row[14] if len(row) > 14 else "",  # O (не M!)
-                            "status": status,
-                        }
+                        request_data = DevRequest(
+                            row_number=row_idx,
+                            date=row[0] if len(row) > 0 else "",
+                            request_id=row[1] if len(row) > 1 else "",
+                            request_type=row[2] if len(row) > 2 else "",
+                            sla_days=row[3] if len(row) > 3 else "",
+                            deadline=row[4] if len(row) > 4 else "",
+                            supplier_name=row[5] if len(row) > 5 else "",
+                            supplier_inn=row[6] if len(row) > 6 else "",
+                            nomenclature=row[7] if len(row) > 7 else "",
+                            unit=row[8] if len(row) > 8 else "",
+                            price=price,
+                            folder_link=row[10] if len(row) > 10 else "",
+                            certificate_link=row[11] if len(row) > 11 else "",  # L
+                            ocr_link=row[14] if len(row) > 14 else "",  # O (не M!)
+                            status=status,
+                        )
                         requests.append(request_data)
                 
                 return requests
@@ -717,22 +869,19 @@ class GoogleSheetsService:
         
         try:
             def _update():
-                spreadsheet = gc.open_by_key(sheet_id)
-                worksheet = spreadsheet.worksheet(worksheet_name)
-                
-                # Обновляем колонки Q, R, S, T, U (P — "Кто занёс" не трогаем)
-                updates = [
-                    (f"Q{row_number}", "В работе"),
-                    (f"R{row_number}", iiko_name),
-                    (f"S{row_number}", str(iiko_price)),
-                    (f"T{row_number}", act_link),
-                    (f"U{row_number}", taken_by),  # Кто взял в работу
+                # Колонки Q, R, S, T, U идут подряд — пишем их одним диапазоном
+                # и одним запросом values.batchUpdate (P — "Кто занёс" не трогаем)
+                row = [
+                    "В работе",  # Q
+                    iiko_name,  # R
+                    str(iiko_price),  # S
+                    act_link,  # T
+                    taken_by,  # U — кто взял в работу
                 ]
-                
-                for cell, value in updates:
-                    worksheet.update_acell(cell, value)
-                    logger.debug(f"Обновлена ячейка {cell} = {value[:30] if len(value) > 30 else value}")
-                
+                _batch_update_values(gc, sheet_id, {
+                    _a1_range(worksheet_name, f"Q{row_number}:U{row_number}"): [row],
+                })
+                logger.debug(f"Обновлена строка {row_number}: Q:U")
                 return True
             
             return await asyncio.to_thread(_update)
@@ -768,10 +917,8 @@ class GoogleSheetsService:
         
         try:
             def _get_in_progress():
-                spreadsheet = gc.open_by_key(sheet_id)
-                worksheet = spreadsheet.worksheet(worksheet_name)
-                
-                all_rows = worksheet.get_all_values()
+                # Одним запросом читаем только нужные колонки (до U)
+                (all_rows,) = _batch_get_values(gc, sheet_id, [_a1_range(worksheet_name, "A:U")])
                 if len(all_rows) < 2:
                     return []
                 
@@ -796,14 +943,17 @@ class GoogleSheetsService:
                         except ValueError:
                             price = 0.0
                         
+                        request_id = row[1] if len(row) > 1 else ""
+                        supplier_name = row[5] if len(row) > 5 else ""
+                        nomenclature = row[7] if len(row) > 7 else ""
                         request_data = {
                             "row_number": row_idx,
                             "date": row[0] if len(row) > 0 else "",
-                            "request_id": row[1] if len(row) > 1 else "",
+                            "request_id": request_id,
                             "request_type": row[2] if len(row) > 2 else "",
-                            "supplier_name": row[5] if len(row) > 5 else "",
+                            "supplier_name": supplier_name,
                             "supplier_inn": row[6] if len(row) > 6 else "",
-                            "nomenclature": row[7] if len(row) > 7 else "",
+                            "nomenclature": nomenclature,
                             "unit": row[8] if len(row) > 8 else "",
                             "price": price,
                             "folder_link": row[10] if len(row) > 10 else "",
@@ -811,6 +961,8 @@ class GoogleSheetsService:
                             "iiko_name": row[17] if len(row) > 17 else "",  # R
                             "iiko_price": row[18] if len(row) > 18 else "",  # S
                             "status": status,
+                            # Подпись кнопки считается один раз здесь, а не при каждой отрисовке
+                            "label": f"{request_id} | {supplier_name[:15]} | {nomenclature[:15]}",
                         }
                         requests.append(request_data)
                 
@@ -863,23 +1015,19 @@ class GoogleSheetsService:
         
         try:
             def _complete():
-                spreadsheet = gc.open_by_key(sheet_id)
-                worksheet = spreadsheet.worksheet(worksheet_name)
-                
                 completion_date = datetime.now().strftime("%d.%m.%Y %H:%M")
                 
-                updates = [
-                    (f"Q{row_number}", "Завершена"),
-                    (f"V{row_number}", result),
-                    (f"W{row_number}", mass_prorabotka),
-                    (f"X{row_number}", weight_from_label),
-                    (f"Y{row_number}", completion_date),
-                ]
-                
-                for cell, value in updates:
-                    worksheet.update_acell(cell, value)
-                    logger.debug(f"Обновлена ячейка {cell}")
-                
+                # Статус (Q) и идущие подряд V:Y — два диапазона в одном запросе values.batchUpdate
+                _batch_update_values(gc, sheet_id, {
+                    _a1_range(worksheet_name, f"Q{row_number}"): [["Завершена"]],
+                    _a1_range(worksheet_name, f"V{row_number}:Y{row_number}"): [[
+                        result,  # V
+                        mass_prorabotka,  # W
+                        weight_from_label,  # X
+                        completion_date,  # Y
+                    ]],
+                })
+                logger.debug(f"Обновлена строка {row_number}: Q, V:Y")
                 return True
             
             return await asyncio.to_thread(_complete)
@@ -896,6 +1044,10 @@ class GoogleSheetsService:
         """
         Получить email поставщика по ИНН.
         
+        Соответствие ИНН -> email загружается одним запросом для всего листа и
+        кешируется на SUPPLIER_EMAILS_TTL; если ИНН в загруженных данных нет,
+        лист перечитывается не чаще раза в SUPPLIER_EMAILS_MISS_TTL.
+        
         Args:
             sheet_id: ID таблицы
             inn: ИНН поставщика
@@ -908,32 +1060,37 @@ class GoogleSheetsService:
         
         logger.debug(f"get_supplier_email_by_inn: inn={inn}")
         
+        key = (sheet_id, worksheet_name)
+        now = time.monotonic()
+        cached = _supplier_emails_cache.get(key)
+        if cached:
+            age = now - cached[0]
+            if age < SUPPLIER_EMAILS_MISS_TTL or (inn in cached[1] and age < SUPPLIER_EMAILS_TTL):
+                return cached[1].get(inn) or None
+        
         gc = await self._get_client()
         if not gc:
             return None
         
         try:
-            def _get_email():
-                spreadsheet = gc.open_by_key(sheet_id)
-                worksheet = spreadsheet.worksheet(worksheet_name)
+            def _get_emails() -> dict[str, str]:
+                (rows,) = _batch_get_values(gc, sheet_id, [_a1_range(worksheet_name, "A:E")])
                 
-                all_rows = worksheet.get_all_values()
-                if len(all_rows) < 2:
-                    return None
-                
-                # Колонка B = ИНН (индекс 1), колонка E = Email (индекс 4)
-                for row in all_rows[1:]:
+                # Колонка B = ИНН (индекс 1), колонка E = Email (индекс 4);
+                # при повторах ИНН берётся первая строка
+                emails: dict[str, str] = {}
+                for row in rows[1:]:
                     row_inn = row[1] if len(row) > 1 else ""
-                    if row_inn == inn:
-                        email = row[4] if len(row) > 4 else ""
-                        return email if email else None
-                
-                return None
+                    emails.setdefault(row_inn, row[4] if len(row) > 4 else "")
+                return emails
             
-            return await asyncio.to_thread(_get_email)
+            emails = await asyncio.to_thread(_get_emails)
         except Exception as e:
             logger.error(f"Ошибка получения email поставщика: {e}", exc_info=True)
             return None
+        
+        _supplier_emails_cache[key] = (now, emails)
+        return emails.get(inn) or None
 
 
 # Singleton instance
@@ -1,11 +1,13 @@
 """Сервис для работы с iiko API."""
 from __future__ import annotations
 
+import asyncio
 import xml.etree.ElementTree as ET
+from collections import defaultdict
 from contextlib import asynccontextmanager
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import AsyncIterator, Optional
+from typing import AsyncIterator, Iterable, Optional
 
 import httpx
 from loguru import logger
@@ -29,7 +31,7 @@ class IikoDepartment:
     type: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class IikoProduct:
     """Продукт из iiko."""
     id: str
@@ -39,6 +41,11 @@ class IikoProduct:
     cooking_place_type: str
     main_unit: str
     product_category: str
+    # Подпись кнопки в списке найденных продуктов
+    label: str = field(init=False, compare=False, repr=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "label", self.name[:40])
 
 
 @dataclass
@@ -55,7 +62,8 @@ class IikoService:
     """Сервис для работы с iiko API.
     
     ВАЖНО: Всегда использовать контекстный менеджер session() для работы с API.
-    Это гарантирует правильный login/logout.
+    Это гарантирует правильный login/logout. Одновременно открытые сессии
+    используют один токен: logout выполняется, когда закрывается последняя.
     """
     
     def __init__(self):
@@ -63,6 +71,9 @@ class IikoService:
         self._login = IIKO_LOGIN
         self._password = IIKO_PASSWORD
         self._client = httpx.AsyncClient(timeout=60.0, verify=False)
+        self._token: Optional[str] = None
+        self._token_users = 0
+        self._token_lock = asyncio.Lock()
     
     async def _login_api(self) -> str:
         """Авторизация в iiko API. Возвращает токен."""
@@ -96,17 +107,26 @@ class IikoService:
     async def session(self) -> AsyncIterator[str]:
         """Контекстный менеджер для работы с iiko API.
         
-        Гарантирует login при входе и logout при выходе.
+        Гарантирует login при входе и logout при выходе. Если токен уже
+        получен другой активной сессией, он переиспользуется без повторного login.
         
         Usage:
             async with iiko_service.session() as token:
                 products = await iiko_service.get_products(token)
         """
-        token = await self._login_api()
+        async with self._token_lock:
+            if self._token is None:
+                self._token = await self._login_api()
+            self._token_users += 1
+            token = self._token
         try:
             yield token
         finally:
-            await self._logout_api(token)
+            async with self._token_lock:
+                self._token_users -= 1
+                if self._token_users == 0:
+                    self._token = None
+                    await self._logout_api(token)
     
     async def get_departments(self, token: str) -> list[IikoDepartment]:
         """Получить список всех департаментов из iiko.
@@ -482,13 +502,102 @@ async def sync_products_to_db() -> int:
         
         await session.commit()
     
+    # Перестраиваем индекс поиска по свежим данным
+    global _search_index, _search_index_version
+    _search_index = _build_search_index(products)
+    _search_index_version += 1
+    
     logger.info(f"sync_products_to_db: synced {len(products)} products")
     return len(products)
 
 
-async def search_products(query: str, limit: int = 10) -> list[dict]:
+@dataclass
+class _ProductSearchIndex:
+    """Триграммный индекс кеша продуктов для поиска по подстроке."""
+    products: list[IikoProduct]
+    names_lower: list[str]
+    postings: dict[str, set[int]]  # триграмма названия -> индексы продуктов
+    by_name: dict[str, IikoProduct]  # нормализованное название -> продукт
+
+
+_NGRAM = 3  # запросы короче проверяются перебором названий
+_search_index: Optional[_ProductSearchIndex] = None
+_search_index_version = 0  # увеличивается при каждой синхронизации кеша
+
+
+def search_index_version() -> int:
+    """Версия данных поиска — меняется после синхронизации продуктов из iiko."""
+    return _search_index_version
+
+
+def _normalize_name(name: str) -> str:
+    """Название для точного сравнения: нижний регистр, схлопнутые пробелы."""
+    return " ".join(name.lower().split())
+
+
+def _ngrams(text: str) -> set[str]:
+    """Все подстроки длины _NGRAM."""
+    return {text[i:i + _NGRAM] for i in range(len(text) - _NGRAM + 1)}
+
+
+def _build_search_index(products: list[IikoProduct]) -> _ProductSearchIndex:
+    """Построить индекс по списку продуктов (порядок списка сохраняется в выдаче)."""
+    names_lower = [p.name.lower() for p in products]
+    postings: dict[str, set[int]] = defaultdict(set)
+    by_name: dict[str, IikoProduct] = {}
+    for i, name_lower in enumerate(names_lower):
+        for gram in _ngrams(name_lower):
+            postings[gram].add(i)
+        # При дублях названий побеждает первый продукт — как и в выдаче поиска
+        by_name.setdefault(" ".join(name_lower.split()), products[i])
+    return _ProductSearchIndex(
+        products=products,
+        names_lower=names_lower,
+        postings=dict(postings),
+        by_name=by_name,
+    )
+
+
+async def _get_search_index() -> _ProductSearchIndex:
+    """Получить индекс поиска; при первом обращении строится из кеша в БД."""
+    global _search_index
+    if _search_index is None:
+        from bot.models.iiko_product import IikoProductCache
+        from bot.models.base import async_session_factory
+        from sqlalchemy import select
+        
+        async with async_session_factory() as session:
+            result = await session.execute(select(IikoProductCache).order_by(IikoProductCache.id))
+            products = [
+                IikoProduct(
+                    id=p.iiko_id,
+                    num=p.num,
+                    name=p.name,
+                    product_type=p.product_type,
+                    cooking_place_type=p.cooking_place_type,
+                    main_unit=p.main_unit,
+                    product_category=p.product_category,
+                )
+                for p in result.scalars().all()
+            ]
+        _search_index = _build_search_index(products)
+        logger.debug(f"Индекс поиска iiko построен: {len(products)} продуктов")
+    return _search_index
+
+
+async def find_product_by_name(name: str) -> Optional[IikoProduct]:
+    """Продукт из кеша с точно таким же названием (без учёта регистра и лишних пробелов)."""
+    index = await _get_search_index()
+    return index.by_name.get(_normalize_name(name))
+
+
+async def search_products(query: str, limit: int = 10) -> list[IikoProduct]:
     """Поиск продуктов в локальном кеше.
     
+    Кандидаты — пересечение списков продуктов по триграммам запроса (словарные
+    поиски, без перебора словаря), затем проверяется вхождение всего запроса
+    как подстроки. Запросы короче трёх символов проверяются перебором названий.
+    
     Args:
         query: Поисковый запрос (часть названия)
         limit: Максимальное количество результатов
@@ -496,33 +605,31 @@ async def search_products(query: str, limit: int = 10) -> list[dict]:
     Returns:
         Список найденных продуктов
     """
-    from bot.models.iiko_product import IikoProductCache
-    from bot.models.base import async_session_factory
-    from sqlalchemy import select
-    
     logger.debug(f"search_products: query={query}, limit={limit}")
     
     # Нормализуем запрос для регистронезависимого поиска (Python lower() для кириллицы)
     query_lower = query.lower().strip()
+    index = await _get_search_index()
     
-    async with async_session_factory() as session:
-        # Поиск по name_lower (предварительно нормализованному полю)
-        stmt = (
-            select(IikoProductCache)
-            .where(IikoProductCache.name_lower.contains(query_lower))
-            .limit(limit)
-        )
-        result = await session.execute(stmt)
-        products = result.scalars().all()
+    # Название, содержащее запрос, содержит и все его триграммы,
+    # поэтому пересечение даёт надмножество точных совпадений
+    if len(query_lower) < _NGRAM:
+        candidates: Iterable[int] = range(len(index.products))
+    else:
+        candidate_sets = []
+        for gram in _ngrams(query_lower):
+            ids = index.postings.get(gram)
+            if not ids:
+                return []
+            candidate_sets.append(ids)
+        # Пересекаем начиная с самого короткого списка
+        candidate_sets.sort(key=len)
+        candidates = sorted(candidate_sets[0].intersection(*candidate_sets[1:]))
     
-    return [
-        {
-            "id": p.iiko_id,
-            "num": p.num,
-            "name": p.name,
-            "product_type": p.product_type,
-            "main_unit": p.main_unit,
-            "product_category": p.product_category,
-        }
-        for p in products
-    ]
+    results = []
+    for i in candidates:
+        if query_lower in index.names_lower[i]:
+            results.append(index.products[i])
+            if len(results) >= limit:
+                break
+    return results
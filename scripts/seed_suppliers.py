@@ -4,7 +4,6 @@ import asyncio
 
 from loguru import logger
 
-from bot.config import DATABASE_URL
 from bot.models.base import init_db
 from bot.models.company import Company
 from bot.models.supplier import Supplier